@@ -0,0 +1,400 @@
+#!/usr/bin/python
+
+#  ============================================================================
+#							   AXON INSIGHT AG
+#  ============================================================================
+#	 Function Name.........: aicuu_mock_server.py
+#	 Developer.............: Sunwheel team <dn-sunwheel@axonactive.vn>
+#	 Acronym...............: Sunwheel
+#	 Create date...........: 17.10.2026
+#	 Release...............: 1.0.0
+#	 Description...........: Local stand-in for CONOS STS and CONOS AI Customer Update, so conos_aicuu_client.py
+#							 can be measured without the dev/test/int servers (ENVIRONMENT 'local'). Also answers
+#							 the zefix.ch calls of uid_check/GetByUID_ws_client.py.
+#							 Serves:
+#							   POST /conos_oauth/v1.0             : access token (client credentials)
+#							   POST /conos_aicuu/v1.0/person      : person update
+#							   POST /conos_aicuu/v1.0/company     : company update
+#							   POST /conos_aicuu/v1.0/person/bulk : JSON array of person records (conos_aicuu_client.py --batch),
+#							   POST /conos_aicuu/v1.0/company/bulk  answered with one {OBJECT_ID, STATUS} per record
+#							   POST /ZefixREST/api/v1/firm/search.json : zefix.ch firm search (uid_check/GetByUID_ws_client.py)
+#							   GET  /ZefixREST/api/v1/firm/<ehraid>.json : zefix.ch firm details
+#							   GET  /stats                        : requests by path and status, as JSON
+#							 Response time, token lifetime and errors are configurable. gzip and deflate request bodies
+#							 (Content-Encoding) are accepted.
+#	 Input.................: All input passed as options.
+#	 Output................: Requests by path and status on the console when stopped (Ctrl+C or SIGTERM)
+#	 Inputparameters.......: Options (all optional):
+#							   --host=HOST: address to listen on (default 127.0.0.1)
+#							   --port=PORT: port to listen on (default 8765, the one of the 'local' ENVIRONMENT)
+#							   --latency=DIST: response time of the update endpoints in ms (default const:10):
+#							     const:MS, uniform:MIN:MAX, normal:MEAN:STDDEV, lognormal:MEDIAN:SIGMA or exp:MEAN
+#							   --record-cost=MS: additional response time per record of a bulk request (default 0)
+#							   --capacity=N: requests served at the same time, the others wait (default 0: no limit)
+#							   --token-ttl=SECONDS: access tokens are rejected with 401 after SECONDS (default 3600)
+#							   --expires-in=SECONDS: token lifetime told to the client (default --token-ttl).
+#							     Longer than --token-ttl: the client only learns from 401 that its token expired
+#							   --faults=STATUS:RATE[,STATUS:RATE]: share of update requests answered with STATUS
+#							     (e.g. 408:0.01,502:0.02,500:0.005)
+#							   --record-faults=STATUS:RATE[,STATUS:RATE]: share of the records of a bulk request answered
+#							     with STATUS in the response array
+#							   --retry-after=SECONDS: Retry-After header of the injected 408/429/502/503 responses
+#							   --client=ID:SECRET: only accept these credentials (default: any)
+#							   --seed=N: seed of latency and fault injection, for reproducible runs
+#							   --zefix-not-found=RATE: share of UIDs zefix does not know (default 0.1, same UIDs every run)
+#
+#	 Example Function call:
+#			   python aicuu_mock_server.py --latency=lognormal:20:0.5 --faults=502:0.02,408:0.01 --token-ttl=60
+#			   python conos_aicuu_client.py 2 local Admin 123456 sample-test-data/company_1k_1252.txt out.txt 8
+#  =====================================================================================================================
+
+import sys
+import json
+import math
+import random
+import signal
+import threading
+import time
+import uuid
+import gzip
+import zlib
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+sts_path = '/conos_oauth/v1.0'
+aicuu_path = '/conos_aicuu/v1.0'
+endpoints = ('/person', '/company')
+bulk_suffix = '/bulk'
+zefix_path = '/ZefixREST/api/v1/firm/'
+request_decoders = {'gzip': gzip.decompress, 'deflate': zlib.decompress}
+
+mock_config = dict()
+state = None  # MockState, created by main()
+
+
+class Latency:
+	"""
+	Response time distribution (--latency), parameters in milliseconds:
+	  const:MS | uniform:MIN:MAX | normal:MEAN:STDDEV | lognormal:MEDIAN:SIGMA | exp:MEAN
+	Negative samples are served without delay
+	"""
+	expected = {'const': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exp': 1}
+
+	def __init__(self, spec, rng):
+		parts = spec.split(':')
+		self.kind = parts[0]
+		try:
+			self.params = [float(p) for p in parts[1:]]
+		except ValueError:
+			raise ValueError('invalid latency: ' + spec)
+		if self.kind not in self.expected or len(self.params) != self.expected[self.kind]:
+			raise ValueError('invalid latency: ' + spec)
+		self.rng = rng
+
+	def sample(self):
+		"""
+		:return: seconds
+		"""
+		if self.kind == 'uniform':
+			ms = self.rng.uniform(*self.params)
+		elif self.kind == 'normal':
+			ms = self.rng.gauss(*self.params)
+		elif self.kind == 'lognormal':
+			median, sigma = self.params
+			ms = self.rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+		elif self.kind == 'exp':
+			ms = self.rng.expovariate(1.0 / self.params[0]) if self.params[0] > 0 else 0.0
+		else:
+			ms = self.params[0]
+		return max(ms, 0.0) / 1000.0
+
+
+class MockState:
+	"""
+	Tokens and counters shared by all request threads
+	"""
+	def __init__(self):
+		self.rng = random.Random(mock_config['seed'])
+		self.latency = Latency(mock_config['latency'], self.rng)
+		self.slots = threading.BoundedSemaphore(mock_config['capacity']) if mock_config['capacity'] else None
+		self.tokens = {}  # access token -> expiry, time.monotonic()
+		self.counts = collections.Counter()  # 'path status' -> responses
+		self.lock = threading.Lock()
+
+	def new_token(self):
+		token = uuid.uuid4().hex
+		with self.lock:
+			now = time.monotonic()
+			# forget expired tokens, the dictionary stays small on long runs
+			if len(self.tokens) > 1000:
+				self.tokens = {t: expiry for t, expiry in self.tokens.items() if expiry > now}
+			self.tokens[token] = now + mock_config['token_ttl']
+		return token
+
+	def valid_token(self, authorization):
+		if not authorization or not authorization.startswith('Bearer '):
+			return False
+		with self.lock:
+			return self.tokens.get(authorization[7:], 0) > time.monotonic()
+
+	def fault(self, faults):
+		"""
+		:param faults: list of (status code, rate)
+		:return: injected status code, or None
+		"""
+		r = self.rng.random()
+		for status, rate in faults:
+			if r < rate:
+				return status
+			r -= rate
+		return None
+
+	def count(self, path, status):
+		with self.lock:
+			self.counts[path + ' ' + str(status)] += 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'  # keep-alive, like the real servers
+	disable_nagle_algorithm = True  # small responses are not delayed by the client's delayed ACK
+
+	def log_message(self, format, *args):
+		pass  # one line per request would cost more than the request
+
+	def do_GET(self):
+		if self.path == '/stats':
+			with state.lock:
+				counts = dict(state.counts)
+			self.send_json(200, counts, count=False)
+		elif self.path.startswith(zefix_path) and self.path.endswith('.json'):
+			self.zefix_firm(self.path[len(zefix_path):-len('.json')])
+		else:
+			self.send_json(404, {'error': 'not found'})
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		encoding = self.headers.get('Content-Encoding')  # conos_aicuu_client.py --compress
+		if encoding:
+			try:
+				body = request_decoders[encoding](body)
+			except KeyError:
+				self.send_json(415, {'error': 'unsupported Content-Encoding ' + encoding})
+				return
+			except (OSError, EOFError, zlib.error):
+				self.send_json(400, {'error': 'invalid ' + encoding + ' body'})
+				return
+		if self.path == sts_path:
+			self.access_token(body)
+		elif self.path.startswith(aicuu_path) and self.path[len(aicuu_path):] in endpoints:
+			self.update(body)
+		elif self.path.startswith(aicuu_path) and self.path[len(aicuu_path):-len(bulk_suffix)] in endpoints and \
+				self.path.endswith(bulk_suffix):
+			self.update(body, bulk=True)
+		elif self.path == zefix_path + 'search.json':
+			self.zefix_search(body)
+		else:
+			self.send_json(404, {'error': 'not found'})
+
+	def access_token(self, body):
+		form = parse_qs(body.decode('utf-8', 'replace'))
+		client_id = form.get('client_id', [''])[0]
+		client_secret = form.get('client_secret', [''])[0]
+		if form.get('grant_type', [''])[0] != 'client_credentials':
+			self.send_json(400, {'error': 'unsupported_grant_type'})
+		elif mock_config['client'] and mock_config['client'] != (client_id, client_secret):
+			self.send_json(401, {'error': 'invalid_client'})
+		else:
+			self.send_json(200, {'access_token': state.new_token(), 'token_type': 'bearer',
+								 'expires_in': mock_config['expires_in']})
+
+	def update(self, body, bulk=False):
+		if not state.valid_token(self.headers.get('Authorization')):
+			self.send_json(401, {'error': 'invalid_token'})
+			return
+		try:
+			records = json.loads(body.decode('utf-8'))
+		except ValueError:
+			records = None
+		if state.slots is not None:
+			state.slots.acquire()
+		try:
+			delay = state.latency.sample()
+			if bulk and isinstance(records, list):
+				delay += len(records) * mock_config['record_cost'] / 1000.0
+			time.sleep(delay)
+		finally:
+			if state.slots is not None:
+				state.slots.release()
+		status = state.fault(mock_config['faults'])
+		if status is not None:
+			headers = {}
+			if mock_config['retry_after'] is not None and status in (408, 429, 502, 503):
+				headers['Retry-After'] = str(mock_config['retry_after'])
+			self.send_json(status, {'error': 'injected fault'}, headers)
+			return
+		if bulk:
+			if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+				self.send_json(400, {'error': 'invalid request body, expected an array of records'})
+				return
+			results = []
+			for record in records:
+				status = 400 if not record.get('OBJECT_ID') else state.fault(mock_config['record_faults']) or 200
+				results.append({'OBJECT_ID': record.get('OBJECT_ID'), 'STATUS': status})
+			self.send_json(200, results)
+			return
+		try:
+			object_id = records['OBJECT_ID']
+		except (KeyError, TypeError):
+			self.send_json(400, {'error': 'invalid request body'})
+			return
+		self.send_json(200, {'OBJECT_ID': object_id, 'STATUS': 'UPDATED'})
+
+	def zefix_search(self, body):
+		time.sleep(state.latency.sample())
+		try:
+			uid = json.loads(body.decode('utf-8'))['name']
+		except (ValueError, KeyError, TypeError):
+			self.send_json(400, {'error': 'invalid request body'})
+			return
+		# the same UIDs are unknown in every run
+		checksum = zlib.crc32(uid.encode('utf-8'))
+		if checksum % 1000 < mock_config['zefix_not_found'] * 1000:
+			self.send_json(404, {'error': 'not found'})
+		else:
+			self.send_json(200, {'list': [{'ehraid': checksum, 'uid': uid}]})
+
+	def zefix_firm(self, ehraid):
+		time.sleep(state.latency.sample())
+		if not ehraid.isdigit():
+			self.send_json(404, {'error': 'not found'})
+			return
+		self.send_json(200, {'ehraid': int(ehraid), 'legalFormId': 3,
+							 'address': {'organisation': 'Firm ' + ehraid + ' AG', 'street': 'Bahnhofstrasse',
+										 'houseNumber': str(int(ehraid) % 200 + 1), 'swissZipCode': '8001',
+										 'town': 'Zürich'}})
+
+	def send_json(self, status, content, headers=None, count=True):
+		out = json.dumps(content).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json; charset=utf-8')
+		self.send_header('Content-Length', str(len(out)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(out)
+		if count:
+			state.count(self.path, status)
+
+
+def read_options(argv):
+	"""
+	Read '--name=value' options into mock_config
+	"""
+	mock_config['host'] = '127.0.0.1'
+	mock_config['port'] = 8765
+	mock_config['latency'] = 'const:10'
+	mock_config['capacity'] = 0
+	mock_config['record_cost'] = 0.0
+	mock_config['record_faults'] = []
+	mock_config['token_ttl'] = 3600.0
+	mock_config['expires_in'] = None
+	mock_config['faults'] = []
+	mock_config['retry_after'] = None
+	mock_config['client'] = None
+	mock_config['seed'] = None
+	mock_config['zefix_not_found'] = 0.1
+	for arg in argv:
+		name, _, value = arg[2:].partition('=')
+		try:
+			if not arg.startswith('--'):
+				raise ValueError
+			elif name == 'host' and value:
+				mock_config['host'] = value
+			elif name == 'port':
+				mock_config['port'] = int(value)
+			elif name == 'latency':
+				Latency(value, random.Random())  # validate
+				mock_config['latency'] = value
+			elif name == 'capacity':
+				mock_config['capacity'] = int(value)
+			elif name == 'token-ttl':
+				mock_config['token_ttl'] = float(value)
+			elif name == 'expires-in':
+				mock_config['expires_in'] = float(value)
+			elif name in ('faults', 'record-faults'):
+				faults = [(int(status), float(rate)) for status, _, rate in (f.partition(':') for f in value.split(','))]
+				if sum(rate for _, rate in faults) > 1:
+					raise ValueError
+				mock_config[name.replace('-', '_')] = faults
+			elif name == 'record-cost':
+				mock_config['record_cost'] = float(value)
+			elif name == 'retry-after':
+				mock_config['retry_after'] = int(value)
+			elif name == 'client' and ':' in value:
+				mock_config['client'] = tuple(value.split(':', 1))
+			elif name == 'seed':
+				mock_config['seed'] = int(value)
+			elif name == 'zefix-not-found' and 0 <= float(value) <= 1:
+				mock_config['zefix_not_found'] = float(value)
+			else:
+				raise ValueError
+		except ValueError:
+			print('Unknown or invalid option: ' + arg)
+			usage()
+	if mock_config['expires_in'] is None:
+		mock_config['expires_in'] = mock_config['token_ttl']
+
+
+def usage():
+	print()
+	print('\t Usage: python aicuu_mock_server.py [--host=HOST] [--port=PORT] [--latency=DIST] [--capacity=N]')
+	print('\t                                    [--record-cost=MS] [--record-faults=STATUS:RATE,...]')
+	print('\t                                    [--token-ttl=SECONDS] [--expires-in=SECONDS] [--faults=STATUS:RATE,...]')
+	print('\t                                    [--retry-after=SECONDS] [--client=ID:SECRET] [--seed=N]')
+	print('\t                                    [--zefix-not-found=RATE]')
+	print('\t --latency      : const:MS (default const:10), uniform:MIN:MAX, normal:MEAN:STDDEV,')
+	print('\t                  lognormal:MEDIAN:SIGMA or exp:MEAN')
+	print('\t --record-cost  : additional ms per record of a bulk request (default 0)')
+	print('\t --capacity     : requests served at the same time (default 0: no limit)')
+	print('\t --token-ttl    : seconds until an access token is rejected with 401 (default 3600)')
+	print('\t --expires-in   : token lifetime told to the client (default --token-ttl)')
+	print('\t --faults       : share of update requests answered with an error status, e.g. 408:0.01,502:0.02,500:0.005')
+	print('\t --record-faults: share of the records of a bulk request answered with an error status')
+	print('\t --retry-after  : Retry-After header of injected 408/429/502/503 responses')
+	print('\t --client       : only accept this client id and secret (default: any)')
+	print('\t --seed         : seed of latency and fault injection')
+	print('\t --zefix-not-found: share of UIDs unknown to the zefix stand-in (default 0.1)')
+	print('\n\t Example        : python aicuu_mock_server.py --latency=lognormal:20:0.5 --faults=502:0.02 --token-ttl=60')
+	sys.exit(2)
+
+
+def main(argv):
+	global state
+	if '-h' in argv or '--help' in argv:
+		usage()
+	read_options(argv)
+	state = MockState()
+	server = ThreadingHTTPServer((mock_config['host'], mock_config['port']), MockHandler)
+	server.daemon_threads = True
+	print('Mock CONOS STS + AICUU listening on http://%s:%d' % (mock_config['host'], mock_config['port']))
+	print('  + STS: ' + sts_path + '\n  + AICUU: ' + aicuu_path + ' (' + ', '.join(endpoints) + ')')
+	print('  + zefix: ' + zefix_path)
+	print('  + Latency: ' + mock_config['latency'] + ', capacity: ' + (str(mock_config['capacity']) if mock_config['capacity'] else 'no limit') +
+		  ', token ttl: %gs' % mock_config['token_ttl'] +
+		  ', faults: ' + (', '.join('%d: %g' % fault for fault in mock_config['faults']) or 'none'))
+	# stopped by another program (e.g. a benchmark): also show the counters
+	signal.signal(signal.SIGTERM, signal.default_int_handler)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+	print('\nResponses by path and status:')
+	for key, value in sorted(state.counts.items()):
+		print('  + ' + key + ': ' + str(value))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+
+#  ============================================================================
+#							   AXON INSIGHT AG
+#  ============================================================================
+#	 Function Name.........: benchmark_client.py
+#	 Developer.............: Sunwheel team <dn-sunwheel@axonactive.vn>
+#	 Acronym...............: Sunwheel
+#	 Create date...........: 17.10.2026
+#	 Release...............: 1.0.0
+#	 Description...........: Client overhead benchmark. Runs the whole pipeline (read the windows-1252 input file,
+#							 build and serialize the payloads, HTTP, result accounting) of conos_aicuu_client.py and
+#							 uid_check/GetByUID_ws_client.py against aicuu_mock_server.py without latency, so the
+#							 client itself is measured. Each run is its own process; its CPU time and peak RSS come
+#							 from the operating system (os.wait4).
+#							 Input: sample-test-data/*_1k_1252.txt and uid_check/input.txt, scaled up with unique
+#							 ids. The UID pipeline is measured with zefix only (SERVICE_SOURCE 2): the Web service
+#							 WSDL is not served locally. Its concurrency is NUMBER_WORKERS (levels above 64 are skipped).
+#	 Input.................: All input passed as options.
+#	 Output................: One line per run on the console, all results as JSON (--output)
+#	 Inputparameters.......: Options (all optional):
+#							   --scale=N: records per run = N * 1000 (default 10)
+#							   --levels=LIST: comma separated NUMBER_THREAD / NUMBER_WORKERS values (default 1,4,8)
+#							   --engine=thread|async: request engine of conos_aicuu_client.py (default thread)
+#							   --pipelines=LIST: comma separated, from person, company, uid (default all)
+#							   --batch=N: records per bulk request of conos_aicuu_client.py (default 1: no bulk requests)
+#							   --output=FILE: location of the JSON results (default benchmark_client.json)
+#
+#	 Example Function call:
+#			   python benchmark_client.py --scale=20 --levels=1,8 --output=release-1.3.0.json
+#			   python benchmark_client.py --engine=async --levels=8,64,256 --pipelines=company
+#			   python benchmark_client.py --batch=50 --levels=1,4 --pipelines=person
+#  =====================================================================================================================
+
+import sys
+import os
+import json
+import platform
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import conos_aicuu_client as client
+
+here = os.path.dirname(os.path.abspath(__file__))
+uid_dir = os.path.join(os.path.dirname(here), 'uid_check')
+samples = {'person': os.path.join(here, 'sample-test-data', 'person_1k_1252.txt'),
+		   'company': os.path.join(here, 'sample-test-data', 'company_1k_1252.txt'),
+		   'uid': os.path.join(uid_dir, 'input.txt')}
+endpoint_arg = {'person': '1', 'company': '2'}
+mock_port = 8765  # the one of ENVIRONMENT 'local'
+uid_max_workers = 64  # highest NUMBER_WORKERS of GetByUID_ws_client.py
+
+# runs GetByUID_ws_client.py with zefix.ch replaced by the mock server
+uid_runner = 'import sys; sys.path.insert(0, sys.argv.pop(1)); import GetByUID_ws_client as uid; ' \
+			 'uid.zefix_api = sys.argv.pop(1); uid.main(sys.argv[1:])'
+
+bench_config = dict()
+
+
+def read_options(argv):
+	bench_config['scale'] = 10
+	bench_config['levels'] = [1, 4, 8]
+	bench_config['engine'] = 'thread'
+	bench_config['pipelines'] = ['person', 'company', 'uid']
+	bench_config['output'] = 'benchmark_client.json'
+	bench_config['batch'] = 1
+	for arg in argv:
+		name, _, value = arg[2:].partition('=')
+		if name == 'scale' and value.isdigit() and int(value) > 0:
+			bench_config['scale'] = int(value)
+		elif name == 'levels' and all(level.isdigit() and int(level) > 0 for level in value.split(',')):
+			bench_config['levels'] = [int(level) for level in value.split(',')]
+		elif name == 'engine' and value in client.engines:
+			bench_config['engine'] = value
+		elif name == 'pipelines' and value and all(p in samples for p in value.split(',')):
+			bench_config['pipelines'] = value.split(',')
+		elif name == 'batch' and value.isdigit() and 1 <= int(value) <= client.max_batch:
+			bench_config['batch'] = int(value)
+		elif name == 'output' and value:
+			bench_config['output'] = value
+		else:
+			print('Unknown or invalid option: ' + arg)
+			usage()
+
+
+def usage():
+	print()
+	print('\t Usage: python benchmark_client.py [--scale=N] [--levels=LIST] [--engine=thread|async] '
+		  '[--pipelines=LIST] [--batch=N] [--output=FILE]')
+	print('\t --scale        : records per run = N * 1000 (default 10)')
+	print('\t --levels       : comma separated NUMBER_THREAD / NUMBER_WORKERS values (default 1,4,8)')
+	print('\t --engine       : request engine of conos_aicuu_client.py (default thread)')
+	print('\t --pipelines    : comma separated, from person, company, uid (default all)')
+	print('\t --batch        : records per bulk request of conos_aicuu_client.py (default 1: no bulk requests)')
+	print('\t --output       : location of the JSON results (default benchmark_client.json)')
+	print('\n\t Example        : python benchmark_client.py --scale=20 --levels=1,8 --output=release-1.3.0.json')
+	sys.exit(2)
+
+
+def scale_input(sample, copies, target_file, base_lines=1000):
+	"""
+	Write `copies` times the first `base_lines` lines of a sample file. The first column (OBJECT_ID, or the
+	UID) gets the copy number with a fixed width, so it stays unique even once the UID is normalized (the
+	'-' removed). The other bytes stay as they are (windows-1252)
+	:return: number of records written
+	"""
+	with open(sample, 'rb') as fp:
+		lines = [line.rstrip(b'\r\n') for line in fp if line.strip()][:base_lines]
+	records = 0
+	with open(target_file, 'wb') as out:
+		for copy in range(copies):
+			for line in lines:
+				first, tab, rest = line.partition(b'\t')
+				first += b'-%06d' % copy  # UID: CHE239622886 -> CHE239622886-000001
+				out.write(first + tab + rest + b'\n')
+				records += 1
+	return records
+
+
+def port_answers(port):
+	try:
+		socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+		return True
+	except OSError:
+		return False
+
+
+def wait_for_port(port, process, timeout=10.0):
+	"""
+	Wait until the mock server answers. Stop if it exited, e.g. because another one already uses the port
+	"""
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if process.poll() is not None:
+			print('ERROR: the mock server exited with status ' + str(process.returncode) + ', is port ' +
+				  str(port) + ' already in use?')
+			sys.exit(1)
+		if port_answers(port):
+			return
+		time.sleep(0.1)
+	print('ERROR: the mock server does not answer on port ' + str(port))
+	sys.exit(1)
+
+
+def measure(command, cwd):
+	"""
+	Run a command, its output is discarded
+	:return: (wall seconds, CPU seconds (user + system), peak RSS in KiB, exit status)
+	"""
+	started = time.perf_counter()
+	process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	_, status, usage = os.wait4(process.pid, 0)
+	seconds = time.perf_counter() - started
+	process.returncode = os.waitstatus_to_exitcode(status)
+	return seconds, usage.ru_utime + usage.ru_stime, usage.ru_maxrss, process.returncode
+
+
+def run(pipeline, level, input_file, records, work_dir):
+	"""
+	One benchmark run
+	:return: dictionary of results
+	"""
+	output_file = os.path.join(work_dir, pipeline + '_output.txt')
+	report_file = os.path.join(work_dir, pipeline + '_report.json')
+	if pipeline == 'uid':
+		zefix_api = 'http://127.0.0.1:%d/ZefixREST/api/v1/firm/' % mock_port
+		command = [sys.executable, '-c', uid_runner, uid_dir, zefix_api, input_file, output_file, '2', '-1', str(level)]
+	else:
+		command = [sys.executable, os.path.join(here, 'conos_aicuu_client.py'), endpoint_arg[pipeline], 'local',
+				   'benchmark', 'benchmark', input_file, output_file, str(level),
+				   '--engine=' + bench_config['engine'], '--report=' + report_file, '--batch=' + str(bench_config['batch'])]
+	seconds, cpu, rss, exit_status = measure(command, work_dir)
+	result = {'pipeline': pipeline, 'engine': 'thread' if pipeline == 'uid' else bench_config['engine'],
+			  'concurrency': level, 'batch': 1 if pipeline == 'uid' else bench_config['batch'],
+			  'records': records,
+			  'seconds': round(seconds, 3), 'records_per_second': round(records / seconds, 1),
+			  'cpu_seconds_per_1k': round(cpu * 1000.0 / records, 4), 'peak_rss_kib': rss,
+			  'exit_status': exit_status}
+	if pipeline != 'uid' and os.path.exists(report_file):
+		with open(report_file) as fp:
+			report = json.load(fp)
+		result['success'] = report['success']
+		result['p50_ms'] = report['latency']['p50_ms']
+		result['p99_ms'] = report['latency']['p99_ms']
+	return result
+
+
+def main(argv):
+	if '-h' in argv or '--help' in argv:
+		usage()
+	read_options(argv)
+	if port_answers(mock_port):  # the runs would measure another server
+		print('ERROR: port ' + str(mock_port) + ' is already in use, stop the server listening on it')
+		sys.exit(1)
+	mock = subprocess.Popen([sys.executable, os.path.join(here, 'aicuu_mock_server.py'), '--latency=const:0',
+							 '--port=' + str(mock_port)], stdout=subprocess.DEVNULL)
+	results = []
+	try:
+		wait_for_port(mock_port, mock)
+		with tempfile.TemporaryDirectory(prefix='benchmark_client_') as work_dir:
+			for pipeline in bench_config['pipelines']:
+				input_file = os.path.join(work_dir, pipeline + '_input.txt')
+				records = scale_input(samples[pipeline], bench_config['scale'], input_file)
+				for level in bench_config['levels']:
+					if pipeline == 'uid' and level > uid_max_workers:
+						continue
+					result = run(pipeline, level, input_file, records, work_dir)
+					results.append(result)
+					print('{pipeline:<8} {engine:<10} x{concurrency:<4} {records:>8} records '
+						  '{records_per_second:>9,.1f} records/s {cpu_seconds_per_1k:>7.3f} CPU s/1k '
+						  '{peak_rss_kib:>8} KiB RSS  exit {exit_status}'.format(**result))
+	finally:
+		mock.terminate()
+		mock.wait()
+
+	with open(bench_config['output'], 'w') as fp:
+		json.dump({'script': client.script_name, 'version': client.version,
+				   'python': platform.python_version(), 'platform': platform.platform(),
+				   'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'scale': bench_config['scale'],
+				   'results': results}, fp, indent=4)
+	print('Results saved to ' + bench_config['output'])
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
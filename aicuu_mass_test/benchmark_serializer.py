@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+#  ============================================================================
+#							   AXON INSIGHT AG
+#  ============================================================================
+#	 Function Name.........: benchmark_serializer.py
+#	 Developer.............: Sunwheel team <dn-sunwheel@axonactive.vn>
+#	 Acronym...............: Sunwheel
+#	 Create date...........: 17.10.2026
+#	 Release...............: 1.0.0
+#	 Description...........: Micro-benchmark of the request body serialization of conos_aicuu_client.py.
+#							 Compares the former path (prepare_inp_json + json.dumps(indent=4) + encode)
+#							 with PayloadSerializer, on the lines of an input file. No request is sent.
+#	 Input.................: All required input passed as arguments.
+#	 Output................: Records/sec and bytes/record of each path, on the console
+#	 Inputparameters.......: You must specify arguments with the following order:
+#							 ENDPOINT: 1: /v1.0/person, 2: /v1.0/company
+#							 INPUT_FILE: location of requests input file
+#							 ROUNDS: (optional) how many times the file is serialized per path (default 20)
+#
+#	 Example Function call:
+#			   python benchmark_serializer.py 2 sample-test-data/company_1k_1252.txt
+#  =====================================================================================================================
+
+import sys
+import time
+import json
+
+import conos_aicuu_client as client
+
+
+def load_records(input_file):
+	"""
+	Read and split the input lines once, so that only serialization is measured
+	"""
+	records = []
+	with open(input_file, "r", encoding=client.encode) as fp:
+		for line in fp:
+			if len(line) > 1:
+				records.append(line.strip('\n').split('\t'))
+	return records
+
+
+def former_path(data):
+	return json.dumps(client.prepare_inp_json(data), ensure_ascii=False, indent=4).encode('utf-8')
+
+
+def measure(name, serialize, records, rounds):
+	"""
+	Serialize all records `rounds` times, print records/sec and bytes/record
+	"""
+	size = sum(len(serialize(data)) for data in records)  # also warms up
+	started = time.perf_counter()
+	for _ in range(rounds):
+		for data in records:
+			serialize(data)
+	elapsed = time.perf_counter() - started
+	rate = len(records) * rounds / elapsed
+	print('{:<40} {:>12,.0f} records/sec {:>8.1f} bytes/record'.format(name, rate, size / float(len(records))))
+	return rate
+
+
+def main(argv):
+	if len(argv) < 2 or argv[0] not in client.endpoint:
+		print('\t Usage: python benchmark_serializer.py <ENDPOINT> <INPUT_FILE> <ROUNDS>')
+		print('\n\t Example        : python benchmark_serializer.py 2 sample-test-data/company_1k_1252.txt')
+		sys.exit(2)
+	client.conos_config['endpoint'] = client.endpoint[argv[0]]
+	rounds = int(argv[2]) if len(argv) > 2 else 20
+	records = load_records(argv[1])
+	serializer = client.PayloadSerializer(client.payload_fields[client.conos_config['endpoint']])
+
+	# both paths must build the same JSON document
+	for data in records:
+		if json.loads(serializer.serialize(data)) != json.loads(former_path(data)):
+			print('ERROR: PayloadSerializer differs from prepare_inp_json for: ', data)
+			sys.exit(1)
+
+	print('Endpoint: ' + client.conos_config['endpoint'] + ', ' + str(len(records)) + ' records, ' + str(rounds) + ' rounds')
+	former = measure('prepare_inp_json + json.dumps(indent=4)', former_path, records, rounds)
+	compiled = measure('PayloadSerializer', serializer.serialize, records, rounds)
+	print('Speed-up: %.1fx' % (compiled / former))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -17,12 +17,69 @@
 #							 ENDPOINT: make requests to provided endpoint of CONOS AI Customer Update. It's value:
 #							   1: /v1.0/person
 #							   2: /v1.0/company
-#							 ENVIRONMENT: one of following values 'dev', 'test', 'int' or 'prod'
+#							 ENVIRONMENT: one of following values 'dev', 'test', 'int', 'prod' or 'local' (aicuu_mock_server.py)
 #							 CLIENT_ID: Client ID, for obtaining access token
 #							 CLIENT_SECRET: Client secret, for obtaining access token
 #							 INPUT_FILE: location of requests input file
 #							 OUTPUT_FILE: location of the output file (summary)
 #							 NUMBER_THREAD: (optional) number of threads to process data (from 1 -> 8, default is 1)
+#							   With --engine=async: number of concurrent requests (from 1 -> 1000, default is 1)
+#							 Options (optional, anywhere in the argument list):
+#							   --engine=thread|async: request engine. 'async' needs the aiohttp library
+#							   --pool-size=N: keep-alive connections per host, per thread (thread engine, default 1)
+#							     or in total (async engine, default NUMBER_THREAD)
+#							   --keep-alive=SECONDS: keep idle connections open (default 30, 0: close after each request).
+#							     Thread engine: a thread idle for SECONDS opens new connections
+#							   --report=FILE: also write the run summary as JSON
+#							   --window=SECONDS: throughput window of the summary (default 10)
+#							   --rate=RPS: open-loop mode, send RPS requests/second whatever the response times are.
+#							     NUMBER_THREAD still caps the requests in flight; latency is also measured from the
+#							     scheduled send time, so waiting for a free thread is not hidden
+#							   --profile=PROFILE: rate over time in open-loop mode: constant (default), ramp:SECONDS,
+#							     step:STEPS:SECONDS or spike:FACTOR:EVERY:SECONDS
+#							   --processes=N: split INPUT_FILE into N byte ranges, each one sent by its own process with
+#							     NUMBER_THREAD threads (or concurrent requests). --rate is shared between the processes
+#							   --journal=FILE: record finished lines in FILE (one FILE.shardN per process with --processes)
+#							   --resume: skip the lines the journal records as finished, re-send the failed ones.
+#							     Use the same INPUT_FILE and --processes as the interrupted run
+#							   --result-log=FILE: one result per input line (OBJECT_ID, status, latency, retries,
+#							     response) as TSV if FILE ends with .tsv, JSON lines otherwise. One FILE.shardN.ext per
+#							     process with --processes, e.g. results.shard0.tsv for results.tsv
+#							   --retries=N: re-send a request at most N times (default 2)
+#							   --backoff=SECONDS: wait before the n-th re-send: random up to SECONDS * 2^(n-1) (default 0.5).
+#							     A longer Retry-After of the server is respected
+#							   --retry-status=CODES: comma separated status codes to re-send (default 408,429,502,503,504).
+#							     Connection errors and timeouts are always re-sent
+#							   --breaker=RATE: pause sending when more than RATE (0..1) of the last responses are errors
+#							     (default 0.5, 0: never pause)
+#							   --breaker-pause=SECONDS: first pause of the circuit breaker (default 5, doubled while failing)
+#							   --adaptive[=TARGET_MS]: find the concurrency while sending, up to NUMBER_THREAD: +1 while
+#							     latency stays under TARGET_MS and errors are rare, * 0.7 on 408/502, timeouts or latency
+#							     above TARGET_MS (without TARGET_MS: twice the lowest latency). The limit over time is in
+#							     the summary
+#							   --sync-index=FILE: incremental sync. Records sent with status 200 are remembered in the
+#							     SQLite database FILE (hash of the request body, MODIFICATION_DATE); a record with the same
+#							     body as at its last successful sync is not sent again
+#							   --batch=N: send up to N records (1 -> 1000) as one JSON array to the bulk endpoint, e.g.
+#							     /v1.0/company/bulk. The response has one result (OBJECT_ID, STATUS) per record
+#							   --batch-wait=MS: queue a started batch at the latest MS ms after its first record (default 50)
+#							   --bulk-path=PATH: path of the bulk endpoint, after the endpoint path (default /bulk)
+#							   --compress[=gzip|deflate]: compress request bodies (Content-Encoding, default gzip). The summary
+#							     shows bytes before/after and the CPU time of the compression
+#							   --compress-level=N: compression level, 1 (fast) -> 9 (small) (default 6)
+#							   --compress-min=BYTES: send smaller bodies uncompressed (default 1024)
+#							   --status-interval=SECONDS: refresh the status line (progress, requests/s, in flight, queue,
+#							     responses by status, latency) and the live metrics every SECONDS (default 1)
+#							   --metrics-file=FILE: Prometheus textfile (node exporter textfile collector) with the live
+#							     metrics, rewritten at every refresh. With --processes: one file per process, e.g.
+#							     metrics.shard0.prom for metrics.prom, with the label shard="N"
+#							   --metrics-port=PORT: serve the live metrics on http://127.0.0.1:PORT/metrics. With
+#							     --processes: shard N on PORT + N
+#							   --validate[=FILE]: pre-flight check of INPUT_FILE, nothing is sent: column count, ZIP,
+#							     BIRTH_YEAR, BIRTH_DATE and MODIFICATION_DATE formats, encoding and duplicate OBJECT_IDs.
+#							     Rejected lines are written to FILE (default OUTPUT_FILE.rejects) with their line number
+#							     and reasons, the summary shows the rejects by reason. Exit status 1 if a line is rejected.
+#							     With --processes=N the file is checked by N processes
 #
 #	 Outputparameters......:
 #
@@ -39,6 +96,13 @@
 #	   file was saved at data/company/input.txt. Result will be saved at data/company/output.txt Number of threads use
 #	   to run test is 5:
 #			   python conos_aicuu_client.py 2 int Admin 123456 data/company/input.txt data/company/output.txt 5
+#
+#	   4,Same as 3, but with the asyncio engine and 300 requests in flight:
+#			   python conos_aicuu_client.py 2 int Admin 123456 data/company/input.txt data/company/output.txt 300 --engine=async
+#
+#	   5,Against the local mock server, with 2% bad gateway and tokens expiring every minute:
+#			   python aicuu_mock_server.py --faults=502:0.02 --token-ttl=60
+#			   python conos_aicuu_client.py 2 local Admin 123456 sample-test-data/company_1k_1252.txt output.txt 8
 #  =====================================================================================================================
 #		  Release notes:
 #				  20.07.2017 Sunwheel
@@ -56,18 +120,59 @@
 #				  20.11.2017 Sunwheel
 #					  Change mechanism to read file: load each 1000 records per time instead of loading the whole file
 #					  to memory
+#				  17.10.2026 Sunwheel
+#					  Add asyncio request engine (--engine=async) with up to 1000 requests in flight
+#					  Bounded work queue with end-of-input markers instead of busy-waiting threads
+#					  Pooled keep-alive HTTP sessions, connection counters in the summary
+#					  Token manager: refresh access token before it expires, single refresh on 401
+#					  Latency percentiles, responses by status, retries and throughput in the summary
+#					  Open-loop mode with target rate and ramp/step/spike profiles (--rate, --profile)
+#					  Multi-process mode: input file split into byte ranges, one process per range (--processes)
+#					  Journal of finished lines, resume an interrupted run (--journal, --resume)
+#					  Compact request bodies from a precompiled serializer (PayloadSerializer)
+#					  Read the input file once, in large chunks. Progress from the byte offset, twice a second
+#					  Per-record result log written by its own thread (--result-log), thread safe console log
+#					  Retry policy with exponential backoff, jitter and Retry-After, circuit breaker (--retries, --breaker)
+#					  Adaptive (AIMD) concurrency limit, its trajectory in the summary (--adaptive)
+#					  ENVIRONMENT 'local': aicuu_mock_server.py, with latency, token expiry and fault injection
+#					  Incremental sync: only send records changed since their last successful sync (--sync-index)
+#					  Bulk requests of up to N records, results mapped back to each record (--batch)
+#					  gzip/deflate compression of request bodies, bytes and CPU time in the summary (--compress)
+#					  Pre-flight validation of the input file with a rejects file (--validate)
+#					  Fixed-rate status line, live Prometheus metrics as textfile or on HTTP (--metrics-file, --metrics-port)
 #  =====================================================================================================================
 
 
 import sys
 import requests
+import urllib3
 import time
 import json
 
+import asyncio
+import email.utils
+import multiprocessing
+import os
+import random
 import threading
-from queue import Queue
-from datetime import datetime
+from queue import Queue, Full, Empty
+from datetime import datetime, timezone
 import collections
+import gzip
+import hashlib
+import http.server
+import itertools
+import operator
+import re
+import shutil
+import sqlite3
+import zlib
+from json.encoder import encode_basestring
+
+try:
+	import aiohttp
+except ImportError:  # only needed by the asyncio engine
+	aiohttp = None
 
 script_name = 'conos_aicuu_client.py'
 version = '1.3.0'
@@ -76,57 +181,1361 @@ release_date = '2017-10-31'
 conos_config = dict()
 encode = 'windows-1252'
 endpoint = {'1': '/person', '2': '/company'}
+engines = ('thread', 'async')
+max_threads = 8
+max_async_requests = 1000
+max_batch = 1000  # records per bulk request
+
+# column -> JSON field mapping of each endpoint, in JSON attribute order. A field is taken from the column
+# with the given index (int), or is a constant (str). CONTACT is a list of nested objects.
+# Same payload as prepare_inp_json(), used by PayloadSerializer
+payload_fields = {
+	'/person': [('OBJECT_ID', 0), ('SYNCHRONISATION', 1), ('SEX_CODE', 2), ('TITLE', 3), ('FIRST_NAME', 4),
+				('LAST_NAME', 5), ('BIRTH_YEAR', 6), ('BIRTH_DATE', 7), ('ADDITIONAL_ADDRESS', 8),
+				('STREET_NAME', 9), ('STREET_NUMBER', 10), ('ZIP', 11), ('CITY', 12), ('CANTON', 13),
+				('COUNTRY_CODE', 14), ('POBOX_NUMBER', 15), ('POBOX_ZIP', 16), ('POBOX_CITY', 17),
+				('MODIFICATION_DATE', 18), ('PHONENUM', 19), ('MOBILENUM', 20), ('EMAIL', 21)],
+	'/company': [('OBJECT_ID', 0), ('SYNCHRONISATION', 1), ('UID', 2), ('COMPANY_NAME', 3),
+				 ('ADDITIONAL_ADDRESS', 4), ('STREET_NAME', 5), ('STREET_NUMBER', 6), ('ZIP', 7), ('CITY', 8),
+				 ('CANTON', 9), ('COUNTRY_CODE', 10), ('POBOX_NUMBER', 11), ('POBOX_ZIP', 12), ('POBOX_CITY', 13),
+				 ('MODIFICATION_DATE', 14), ('PHONENUM', 15), ('MOBILENUM', 16), ('FAXNUM', 17), ('EMAIL', 18),
+				 ('URL', 19),
+				 ('CONTACT', [[('FUNCTION', 'CEO'), ('OBJECT_ID', 20), ('SEX_CODE', 21), ('TITLE', 22),
+							   ('FIRST_NAME', 23), ('LAST_NAME', 24)],
+							  [('FUNCTION', 'CFO'), ('OBJECT_ID', 25), ('SEX_CODE', 26), ('TITLE', 27),
+							   ('FIRST_NAME', 28), ('LAST_NAME', 29)],
+							  [('FUNCTION', 'CFO'), ('OBJECT_ID', 30), ('SEX_CODE', 31), ('TITLE', 32),
+							   ('FIRST_NAME', 33), ('LAST_NAME', 34)]])]}
+
+# format of the columns checked by --validate (regular expressions, a column must match as a whole).
+# Columns not listed here may hold any text
+date_format = '(?:19|20)[0-9]{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12][0-9]|3[01])'  # YYYYMMDD
+field_formats = {'OBJECT_ID': '[^\t]+', 'ZIP': '[0-9]*', 'POBOX_ZIP': '[0-9]*', 'BIRTH_YEAR': '(?:[0-9]{4})?',
+				 'BIRTH_DATE': '(?:' + date_format + ')?', 'MODIFICATION_DATE': '(?:' + date_format + ')?'}
 
 dev_sts_url = 'http://192.168.80.13:8080/conos_oauth/v1.0'
 test_sts_url = 'http://conos-oauth-test.mappuls.int/v1.0'
 int_sts_url = 'https://conos-oauth-int.axoninsight.com/v1.0'
 prod_sts_url = 'https://conos-oauth.axoninsight.com/v1.0'
+local_sts_url = 'http://127.0.0.1:8765/conos_oauth/v1.0'  # aicuu_mock_server.py
 
 dev_aicuu_url = 'http://192.168.80.13:8080/conos_aicuu/v1.0'
 test_aicuu_url = 'http://conos-customer-update-test.mappuls.int/v1.0'
 int_aicuu_url = 'https://conos-customer-update-int.axoninsight.com/v1.0'
 prod_aicuu_url = 'https://conos-customer-update.axoninsight.com/v1.0'
+local_aicuu_url = 'http://127.0.0.1:8765/conos_aicuu/v1.0'  # aicuu_mock_server.py
 
 console = ''
-queueLock = threading.Lock()
-workQueue = Queue()
+consoleLock = threading.Lock()
+console_spill_size = 64 * 1024  # characters of console log kept before they are written to the output file
+counterLock = threading.Lock()
+queue_size = 1000  # lines read ahead of the workers
+workQueue = Queue(maxsize=queue_size)
 threads = []
-exitFlag = 0
-num_lines = 0
+worker_aborted = False  # a worker thread stopped the run, e.g. got status 403
+read_chunk_size = 1024 * 1024  # bytes read from the input file at once
+progress = None
+shard_status = None  # ShardStatus, in the shard processes of --processes
+metrics = None  # MetricsExporter: status line, --metrics-file, --metrics-port
 count = 0
 success = 0
 url = ''
+bulk_url = ''  # --batch
 data_file_name = ''
 headers = ''
+token_manager = None
 token_expired = True
 target = None
-openQueue = False
+stats = None
+journal = None
+result_writer = None
+retry_policy = None
+breaker = None  # None: circuit breaker disabled (--breaker=0)
+limiter = None  # None: fixed concurrency, see --adaptive
+compressor = None  # None: bodies sent as they are, see --compress
+serializer = None
+skipped = 0  # lines finished by an earlier run (--resume)
+sync_index = None
+unchanged = 0  # records not sent, same payload as the last successful sync (--sync-index)
+pool_local = threading.local()  # HTTP session of each thread
+http_sessions = []
+sessionsLock = threading.Lock()
+http_connects = 0  # TCP connects of the requests sessions, see CountingHTTPConnection
+retired_requests = 0  # requests sent by the sessions dropped after --keep-alive seconds idle
+connections_opened = 0  # asyncio engine only, see run_async_engine()
+connections_reused = 0
 
 
 # ======================================================================================================================
-def obtain_access_token():
+class CountingHTTPConnection(urllib3.connection.HTTPConnection):
+	def connect(self):
+		global http_connects
+		with sessionsLock:
+			http_connects += 1
+		super().connect()
+
+
+class CountingHTTPSConnection(urllib3.connection.HTTPSConnection):
+	def connect(self):
+		global http_connects
+		with sessionsLock:
+			http_connects += 1
+		super().connect()
+
+
+class CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+	ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+	ConnectionCls = CountingHTTPSConnection
+
+
+def get_session():
+	"""
+	get_session() -> requests.Session of the current thread
+
+	Each thread keeps its own session, so connections (and TLS sessions) to STS and AICUU are reused
+	instead of being opened for every request. A session not used for --keep-alive seconds is replaced:
+	the server may have closed its idle connections by then.
+	"""
+	global retired_requests
+	session = getattr(pool_local, 'session', None)
+	now = time.monotonic()
+	if session is not None and conos_config['keep_alive'] and now - pool_local.last_used > conos_config['keep_alive']:
+		with sessionsLock:
+			http_sessions.remove(session)
+			retired_requests += session_requests(session)
+		session.close()
+		session = None
+	pool_local.last_used = now
+	if session is None:
+		session = requests.Session()
+		# one pool per host (STS + AICUU)
+		adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=conos_config['pool_size'])
+		adapter.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+													  'https': CountingHTTPSConnectionPool}
+		session.mount('http://', adapter)
+		session.mount('https://', adapter)
+		if conos_config['keep_alive'] == 0:
+			session.headers['Connection'] = 'close'
+		pool_local.session = session
+		with sessionsLock:
+			http_sessions.append(session)
+	return session
+
+
+def session_requests(session):
+	"""
+	:return: number of requests sent by an HTTP session
+	"""
+	sent = 0
+	for adapter in set(session.adapters.values()):
+		pools = adapter.poolmanager.pools
+		for key in pools.keys():
+			sent += pools[key].num_requests
+	return sent
+
+
+def connection_stats():
+	"""
+	Count connections opened and reused by all HTTP sessions
+	:return: tuple (opened, reused)
+	"""
+	with sessionsLock:
+		sent = retired_requests + sum(session_requests(session) for session in http_sessions)
+		opened = connections_opened + http_connects
+		reused = connections_reused + max(sent - http_connects, 0)
+	return opened, reused
+
+
+def request_access_token():
 	"""
-	obtain_access_token() -> Get access token
+	request_access_token() -> (authorization, expires_in)
 
 	Obtain access token from provided credential (client id + client secret).
+	expires_in is the token lifetime in seconds, None if STS does not tell.
+	Raise requests.exceptions.RequestException on error.
 	"""
 	post_data = {'grant_type': 'client_credentials',
 				 'client_id': conos_config['client_id'],
 				 'client_secret': conos_config['client_secret']}
 
+	response = get_session().post(url=conos_config['sts_url'], data=post_data, timeout=60)  # 60 seconds
+	if response.ok:
+		body = response.json()
+		expires_in = body.get('expires_in')
+		return 'Bearer ' + body['access_token'], (float(expires_in) if expires_in else None)
+	else:
+		print('\nERROR: Can not obtain access token')
+		print('\nResponse error: ', response.json())
+		response.raise_for_status()
+
+
+def obtain_access_token():
+	"""
+	obtain_access_token() -> (authorization, expires_in)
+
+	Same as request_access_token(), but stop the script on error.
+	"""
 	try:
-		response = requests.post(url=conos_config['sts_url'], data=post_data, timeout=60)  # 60 seconds
-		if response.ok:
-			return 'Bearer ' + response.json()['access_token']
-		else:
-			print('\nERROR: Can not obtain access token')
-			print('\nResponse error: ', response.json())
-			response.raise_for_status()
+		return request_access_token()
 	except requests.exceptions.RequestException as e:
 		# All exceptions that Requests explicitly raises inherit from requests.exceptions.RequestException
 		print("Root cause: ", e)
 		sys.exit(1)
 
+
+class TokenManager:
+	"""
+	Hold the current access token for all workers.
+
+	Workers read `authorization` without locking. A background thread refreshes the token shortly
+	before it expires. When a worker still gets 401, refresh() lets one caller obtain a new token
+	while the others wait for it and reuse it (single flight), so the STS is not stampeded.
+	"""
+	def __init__(self):
+		self.authorization = None
+		self.expires_at = None  # time.time() based, None: unknown lifetime
+		self.refresh_count = 0
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = None
+
+	def start(self):
+		self._store(*obtain_access_token())
+		self._thread = threading.Thread(target=self._run, name='TokenManager', daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+
+	def refresh(self, rejected):
+		"""
+		Obtain a new token after `rejected` got 401, unless another caller already replaced it
+		:param rejected: the Authorization value that was rejected
+		:return: the current Authorization value
+		"""
+		with self._lock:
+			if self.authorization == rejected:
+				self._store(*obtain_access_token())
+			return self.authorization
+
+	def _store(self, authorization, expires_in):
+		self.refresh_count += 1
+		self.authorization = authorization
+		if expires_in:
+			self.expires_at = time.time() + expires_in
+			# refresh 60 seconds before expiry, or after 90% of a short lifetime
+			self._margin = min(60.0, expires_in * 0.1)
+		else:
+			self.expires_at = None
+
+	def _run(self):
+		while True:
+			if self.expires_at is None:
+				wait = 60  # lifetime unknown, only refresh on 401
+			else:
+				wait = max(self.expires_at - self._margin - time.time(), 0)
+			if self._stop.wait(wait):
+				return
+			if self.expires_at is None or time.time() < self.expires_at - self._margin:
+				continue
+			with self._lock:
+				try:
+					self._store(*request_access_token())
+				except requests.exceptions.RequestException as e:
+					print('\nCan not refresh access token, will try again. Root cause: ', e)
+					self._stop.wait(5)
+
+
+def request_headers():
+	"""
+	Headers of an AICUU request, with the current access token
+	"""
+	return {'Content-Type': headers['Content-Type'], 'Authorization': token_manager.authorization}
+
+class Journal:
+	"""
+	Append-only journal of finished input lines, so an interrupted run can be resumed (--journal, --resume).
+
+	Lines are identified by their byte offset in the input file. Records:
+	  D <offset>: line finished (status 200, or rejected by a 4xx that re-sending would not change)
+	  F <offset>: line failed (5xx, time-out, network error), to be re-sent by --resume
+	  W <offset>: every line before this offset is finished or recorded as F
+	Records are buffered and the file is flushed + fsync'ed at most once per `sync_interval` seconds.
+	"""
+	def __init__(self, file_name, resume=False, sync_interval=1.0):
+		self.file_name = file_name
+		self.sync_interval = sync_interval
+		self.watermark = 0
+		self.done = set()  # offsets >= watermark finished by an earlier run
+		self.failed = set()  # offsets < watermark to re-send
+		self.skipped = 0
+		if resume:
+			self._load()
+		self._fp = open(file_name, "a" if resume else "w")
+		self._in_flight = collections.deque()  # dispatched offsets, in input order
+		self._resolved = set()  # offsets of _in_flight which are finished
+		self._end = None  # end of the input, once all of it was dispatched
+		self._last_sync = time.time()
+		self._lock = threading.Lock()
+
+	def _load(self):
+		if not os.path.exists(self.file_name):
+			return
+		complete = 0  # bytes of the complete records
+		with open(self.file_name, 'rb') as fp:
+			for record in fp:
+				if not record.endswith(b'\n'):
+					break  # record cut by a crash, e.g. 'D 12' of 'D 1234'
+				complete += len(record)
+				kind, _, offset = record.decode('ascii', 'replace').strip().partition(' ')
+				if not offset.isdigit():
+					continue
+				offset = int(offset)
+				if kind == 'D':
+					self.done.add(offset)
+					self.failed.discard(offset)
+				elif kind == 'F':
+					self.failed.add(offset)
+				elif kind == 'W':
+					self.watermark = max(self.watermark, offset)
+		self.done = set(offset for offset in self.done if offset >= self.watermark)
+		self.failed = set(offset for offset in self.failed if offset < self.watermark)
+		os.truncate(self.file_name, complete)  # the next records must not be appended to a cut one
+
+	def dispatched(self, offset):
+		with self._lock:
+			self._in_flight.append(offset)
+
+	def finished(self, offset, done):
+		"""
+		:param offset: byte offset of the line
+		:param done: True if the line must not be sent again
+		"""
+		with self._lock:
+			if self._fp is None:
+				return
+			self._fp.write(('D ' if done else 'F ') + str(offset) + '\n')
+			self._resolved.add(offset)
+			while self._in_flight and self._in_flight[0] in self._resolved:
+				self._resolved.discard(self._in_flight.popleft())
+			if time.time() - self._last_sync >= self.sync_interval:
+				self._sync()
+
+	def end_of_input(self, end):
+		"""
+		All lines before byte offset `end` were dispatched
+		"""
+		with self._lock:
+			self._in_flight.append(end)
+			self._resolved.add(end)
+			self._end = end
+
+	def _sync(self):
+		if self._in_flight:
+			self._fp.write('W ' + str(self._in_flight[0]) + '\n')
+		elif self._end is not None:  # every line finished: a resume reads nothing again
+			self._fp.write('W ' + str(self._end) + '\n')
+		self._fp.flush()
+		os.fsync(self._fp.fileno())
+		self._last_sync = time.time()
+
+	def close(self):
+		with self._lock:
+			if self._fp is None:
+				return
+			while self._in_flight and self._in_flight[0] in self._resolved:
+				self._resolved.discard(self._in_flight.popleft())
+			self._sync()
+			self._fp.close()
+			self._fp = None
+
+
+class SyncIndex:
+	"""
+	Persistent index of the records last accepted by AICUU (--sync-index), to send only new or changed ones.
+
+	SQLite table keyed by environment, endpoint and OBJECT_ID, holding a hash of the serialized payload and the
+	MODIFICATION_DATE of the record. A record whose payload hash is in the index is not sent again.
+	Entries are written after a status 200, in batches of `batch_size`. Shard processes share the file (WAL mode)
+	"""
+	def __init__(self, file_name, environment, endpoint, date_column=None, batch_size=500):
+		self.environment = environment
+		self.endpoint = endpoint
+		self.date_column = date_column
+		self.batch_size = batch_size
+		self._db = sqlite3.connect(file_name, timeout=60, check_same_thread=False)
+		self._db.execute('PRAGMA journal_mode=WAL')
+		self._db.execute('PRAGMA synchronous=NORMAL')
+		self._db.execute('CREATE TABLE IF NOT EXISTS sync_index (environment TEXT, endpoint TEXT, object_id TEXT, '
+						 'payload_hash BLOB, modification_date TEXT, synced_at TEXT, '
+						 'PRIMARY KEY (environment, endpoint, object_id)) WITHOUT ROWID')
+		self._db.commit()
+		self._pending = []
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def digest(data):
+		return hashlib.blake2b(data, digest_size=16).digest()
+
+	def unchanged(self, object_id, digest):
+		"""
+		Whether the record was accepted with the same payload before
+		"""
+		with self._lock:
+			row = self._db.execute('SELECT payload_hash FROM sync_index WHERE environment = ? AND endpoint = ? '
+								   'AND object_id = ?', (self.environment, self.endpoint, object_id)).fetchone()
+		return row is not None and row[0] == digest
+
+	def synced(self, fields, digest):
+		"""
+		Record that AICUU accepted the record
+		:param fields: columns of the input line
+		"""
+		modification_date = fields[self.date_column] if self.date_column is not None and self.date_column < len(fields) else None
+		with self._lock:
+			self._pending.append((self.environment, self.endpoint, fields[0], digest, modification_date,
+								  datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+			if len(self._pending) >= self.batch_size:
+				self._write()
+
+	def _write(self):
+		self._db.executemany('INSERT OR REPLACE INTO sync_index VALUES (?, ?, ?, ?, ?, ?)', self._pending)
+		self._db.commit()
+		self._pending = []
+
+	def close(self):
+		with self._lock:
+			if self._db is None:
+				return
+			if self._pending:
+				self._write()
+			self._db.close()
+			self._db = None
+
+
+class BodyCompressor:
+	"""
+	Compress request bodies (--compress): gzip or deflate at `level`, bodies smaller than `min_size` bytes
+	are sent as they are. Bytes before/after and the CPU time of the compression are added to the run statistics
+	"""
+	offload_size = 64 * 1024  # asyncio engine: larger bodies are compressed in a thread, off the event loop
+
+	def __init__(self, statistics, encoding='gzip', level=6, min_size=1024):
+		self.statistics = statistics
+		self.encoding = encoding
+		self.level = level
+		self.min_size = min_size
+
+	def compress(self, data):
+		"""
+		:return: (body to send, Content-Encoding or None)
+		"""
+		if len(data) < self.min_size:
+			self.statistics.record_body(len(data), len(data))
+			return data, None
+		started = time.thread_time()
+		if self.encoding == 'gzip':
+			compressed = gzip.compress(data, compresslevel=self.level, mtime=0)
+		else:
+			compressed = zlib.compress(data, self.level)
+		self.statistics.record_body(len(data), len(compressed), time.thread_time() - started)
+		return compressed, self.encoding
+
+
+def is_finished(status_code):
+	"""
+	Whether a line with this final status code must not be sent again by --resume
+	"""
+	if status_code is None:  # network error
+		return False
+	return status_code == 200 or (400 <= status_code < 500 and status_code not in (401, 403, 408, 429))
+
+
+class RetryPolicy:
+	"""
+	When and after how long a failed request is sent again (--retries, --backoff, --retry-status).
+	The wait before re-send number n is random between 0 and backoff * 2^(n-1) seconds ('full jitter', at most
+	max_backoff), so the clients do not re-send together. A longer Retry-After of the server is respected
+	"""
+	def __init__(self, max_retries=2, backoff=0.5, statuses=(408, 429, 502, 503, 504), max_backoff=30.0,
+				 max_retry_after=120.0):
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.statuses = frozenset(statuses)
+		self.max_backoff = max_backoff
+		self.max_retry_after = max_retry_after
+
+	@staticmethod
+	def retryable_error(error):
+		"""
+		Whether a request that got no response may be sent again: connection problems and timeouts only
+		"""
+		if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, asyncio.TimeoutError)):
+			return True
+		return aiohttp is not None and isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+	@staticmethod
+	def parse_retry_after(value):
+		"""
+		:param value: Retry-After header, seconds or HTTP date
+		:return: seconds to wait, or None
+		"""
+		if not value:
+			return None
+		value = value.strip()
+		if value.isdigit():
+			return float(value)
+		try:
+			when = email.utils.parsedate_to_datetime(value)
+		except (TypeError, ValueError, IndexError):
+			return None
+		if when.tzinfo is None:
+			when = when.replace(tzinfo=timezone.utc)
+		return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+	def delay(self, retry, retry_after=None):
+		"""
+		:param retry: number of the re-send, from 1
+		:param retry_after: Retry-After header of the response, if any
+		:return: seconds to wait before the re-send
+		"""
+		delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (retry - 1)))
+		seconds = self.parse_retry_after(retry_after)
+		if seconds is not None:
+			delay = max(delay, min(seconds, self.max_retry_after))
+		return delay
+
+
+class CircuitBreaker:
+	"""
+	Pause sending while the backend is failing (--breaker), instead of adding a retry storm to its load.
+	  closed   : requests are sent. When at least `min_requests` of the last `window` responses are known and
+	             the share of errors (no response, 408, 429, 5xx) is above `threshold`, the breaker opens
+	  open     : nothing is sent for `pause` seconds
+	  half open: one request is sent as a probe. Success closes the breaker, an error opens it again for twice
+	             the previous pause (at most max_pause). Responses to other requests do not count
+	Times opened and seconds open are added to the run statistics
+	"""
+	def __init__(self, statistics, threshold=0.5, pause=5.0, window=50, min_requests=20, max_pause=60.0):
+		self.statistics = statistics
+		self.threshold = threshold
+		self.base_pause = pause
+		self.pause = pause
+		self.min_requests = min_requests
+		self.max_pause = max_pause
+		self.state = 'closed'
+		self._outcomes = collections.deque(maxlen=window)  # True: error
+		self._errors = 0
+		self._open_until = 0.0
+		self._opened_at = 0.0
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def is_error(status_code):
+		return status_code is None or status_code in (408, 429) or status_code >= 500
+
+	def wait_time(self):
+		"""
+		:return: (seconds to wait before sending, 0: send now; True if the caller sends the half-open probe)
+		"""
+		with self._lock:
+			if self.state == 'closed':
+				return 0.0, False
+			now = time.monotonic()
+			if self.state == 'open':
+				if now < self._open_until:
+					return self._open_until - now, False
+				self.state = 'half_open'  # the caller sends the probe
+				return 0.0, True
+			return 0.1, False  # half open: wait for the result of the probe
+
+	def wait(self):
+		"""
+		:return: True if the request to send is the probe, to pass to record()
+		"""
+		delay, probe = self.wait_time()
+		while delay > 0:
+			time.sleep(min(delay, 1.0))
+			delay, probe = self.wait_time()
+		return probe
+
+	async def async_wait(self):
+		delay, probe = self.wait_time()
+		while delay > 0:
+			await asyncio.sleep(min(delay, 1.0))
+			delay, probe = self.wait_time()
+		return probe
+
+	def record(self, status_code, probe=False):
+		"""
+		Add the outcome of a request: status code, or None if there was no response
+		:param probe: the request is the half-open probe (wait() returned True)
+		"""
+		error = self.is_error(status_code)
+		with self._lock:
+			if self.state == 'half_open':
+				if not probe:  # sent before the breaker opened
+					return
+				if error:
+					self._open(min(self.pause * 2, self.max_pause))
+				else:
+					self._close()
+				return
+			if self.state == 'open':  # sent before the breaker opened
+				return
+			if len(self._outcomes) == self._outcomes.maxlen:
+				self._errors -= self._outcomes[0]
+			self._outcomes.append(error)
+			self._errors += error
+			if len(self._outcomes) >= self.min_requests and self._errors > self.threshold * len(self._outcomes):
+				self._opened_at = time.monotonic()
+				self.statistics.record_breaker(opened=1)
+				self._open(self.base_pause)
+				print('\nCircuit breaker open: %d errors in the last %d responses. Pause %gs' %
+					  (self._errors, len(self._outcomes), self.pause))
+
+	def stop(self):
+		"""
+		End of the run: count the time of a breaker still open
+		"""
+		with self._lock:
+			if self.state != 'closed':
+				self._close()
+
+	def _open(self, pause):
+		self.state = 'open'
+		self.pause = pause
+		self._open_until = time.monotonic() + pause
+
+	def _close(self):
+		self.state = 'closed'
+		self.pause = self.base_pause
+		self._outcomes.clear()
+		self._errors = 0
+		self.statistics.record_breaker(open_seconds=time.monotonic() - self._opened_at)
+
+
+class AdaptiveLimit:
+	"""
+	Concurrency limit found while sending (--adaptive), AIMD like TCP congestion control.
+	The workers (NUMBER_THREAD is the maximum) only send while fewer than `limit` requests are in flight.
+	After each round of `limit` responses:
+	  - errors (no response, 408, 429, 5xx) in more than `error_rate` of the round, or average latency above
+	    the target: limit * decrease_ratio (multiplicative decrease)
+	  - else, if the limit was reached during the round: limit + 1 (additive increase)
+	Without a target, latency above `inflation` times the lowest round average counts as above the target.
+	Each round's limit is added to the run statistics (trajectory per window of the summary)
+	"""
+	decrease_ratio = 0.7
+	error_rate = 0.05
+	inflation = 2.0
+
+	def __init__(self, statistics, max_limit, target=0.0, min_limit=1):
+		self.statistics = statistics
+		self.max_limit = max_limit
+		self.min_limit = min_limit
+		self.target = target  # seconds, 0: relative to the lowest latency
+		self.limit = min_limit
+		self.in_flight = 0
+		self.base_latency = None
+		self._saturated = False
+		self._round = 0
+		self._round_errors = 0
+		self._round_latency = 0.0
+		self._condition = threading.Condition()
+		self._async_condition = None  # created in the event loop by async_acquire()
+
+	def acquire(self):
+		with self._condition:
+			while self.in_flight >= self.limit:
+				self._condition.wait()
+			self._start()
+
+	def release(self, status_code, seconds):
+		with self._condition:
+			self._finish(status_code, seconds)
+			self._condition.notify_all()
+
+	async def async_acquire(self):
+		if self._async_condition is None:
+			self._async_condition = asyncio.Condition()
+		async with self._async_condition:
+			await self._async_condition.wait_for(lambda: self.in_flight < self.limit)
+			self._start()
+
+	async def async_release(self, status_code, seconds):
+		async with self._async_condition:
+			self._finish(status_code, seconds)
+			self._async_condition.notify_all()
+
+	def _start(self):
+		self.in_flight += 1
+		if self.in_flight >= self.limit:
+			self._saturated = True
+
+	def _finish(self, status_code, seconds):
+		self.in_flight -= 1
+		self._round += 1
+		self._round_errors += CircuitBreaker.is_error(status_code)
+		self._round_latency += seconds
+		if self._round < self.limit:
+			return
+		latency = self._round_latency / self._round
+		if self.base_latency is None or latency < self.base_latency:
+			self.base_latency = latency
+		target = self.target or self.base_latency * self.inflation
+		if self._round_errors > self.error_rate * self._round or latency > target:
+			self.limit = max(self.min_limit, int(self.limit * self.decrease_ratio))
+		elif self._saturated:
+			self.limit = min(self.max_limit, self.limit + 1)
+		self._round = 0
+		self._round_errors = 0
+		self._round_latency = 0.0
+		self._saturated = self.in_flight >= self.limit
+		self.statistics.record_limit(self.limit)
+
+
+class ResultWriter(threading.Thread):
+	"""
+	Stream one result record per input line to a JSON lines or TSV file (--result-log).
+
+	Workers put records into a bounded queue and this thread writes them in batches, flushing at most
+	once per `flush_interval` seconds. When the disk can not keep up, the workers wait instead of memory growing.
+	Record: byte offset of the line, OBJECT_ID, final status ('error' if no response, 'invalid' if not sent), latency in ms over
+	all attempts, retries and the start of the last response body.
+	"""
+	columns = ('offset', 'object_id', 'status', 'latency_ms', 'retries', 'response')
+	snippet_size = 200  # characters of the response body kept
+
+	def __init__(self, file_name, tsv=False, batch_size=500, flush_interval=1.0):
+		threading.Thread.__init__(self, name='ResultWriter', daemon=True)
+		self.tsv = tsv
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.q = Queue(maxsize=batch_size * 20)
+		self._fp = open(file_name, "w", encoding='utf-8')
+		if tsv:
+			self._fp.write('\t'.join(self.columns) + '\n')
+
+	def put(self, offset, object_id, status_code, seconds, retries, body):
+		status = 'error' if status_code is None else status_code
+		snippet = body[:self.snippet_size * 4].decode('utf-8', 'replace')[:self.snippet_size]
+		self.q.put((offset, object_id, status, round(seconds * 1000, 3), retries, snippet))
+
+	def _format(self, record):
+		if self.tsv:
+			return '\t'.join(' '.join(str(value).split()) for value in record) + '\n'
+		return json.dumps(dict(zip(self.columns, record)), ensure_ascii=False) + '\n'
+
+	def run(self):
+		last_flush = time.monotonic()
+		while True:
+			batch = [self.q.get()]  # wait for the first record
+			while len(batch) < self.batch_size and batch[-1] is not None:
+				try:
+					batch.append(self.q.get_nowait())
+				except Empty:
+					break
+			stop = batch[-1] is None  # end marker, put by close()
+			self._fp.write(''.join(self._format(record) for record in batch if record is not None))
+			if stop or time.monotonic() - last_flush >= self.flush_interval:
+				self._fp.flush()
+				last_flush = time.monotonic()
+			if stop:
+				self._fp.close()
+				return
+
+	def close(self):
+		"""
+		Write the remaining records and close the file
+		"""
+		self.q.put(None)
+		self.join()
+
+
+class LatencyHistogram:
+	"""
+	HDR-style histogram of latencies in microseconds.
+
+	Values are kept in log-linear buckets (128 sub-buckets per power of two, < 1.6% error), so memory
+	depends on the range of latencies only, not on the number of recorded values.
+	"""
+	sub_bucket_bits = 7
+
+	def __init__(self):
+		self.counts = collections.Counter()  # bucket index -> count
+		self.total = 0
+		self.sum = 0
+		self.max = 0
+
+	def record(self, seconds):
+		value = max(int(seconds * 1000000), 0)
+		shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+		self.counts[(shift << self.sub_bucket_bits) | (value >> shift)] += 1
+		self.total += 1
+		self.sum += value
+		self.max = max(self.max, value)
+
+	def merge(self, other):
+		self.counts.update(other.counts)
+		self.total += other.total
+		self.sum += other.sum
+		self.max = max(self.max, other.max)
+
+	def percentile(self, percent):
+		"""
+		:return: latency in milliseconds at the given percentile (upper bound of its bucket)
+		"""
+		if self.total == 0:
+			return 0.0
+		rank = max(percent * self.total / 100.0, 1)
+		seen = 0
+		mask = (1 << self.sub_bucket_bits) - 1
+		for index in sorted(self.counts):
+			seen += self.counts[index]
+			if seen >= rank:
+				shift = index >> self.sub_bucket_bits
+				upper = (((index & mask) + 1) << shift) - 1
+				return min(upper, self.max) / 1000.0
+		return self.max / 1000.0
+
+	def to_dict(self):
+		return {'count': self.total,
+				'p50_ms': self.percentile(50), 'p90_ms': self.percentile(90), 'p99_ms': self.percentile(99),
+				'p99.9_ms': self.percentile(99.9), 'max_ms': self.max / 1000.0}
+
+
+class RunStatistics:
+	"""
+	Thread safe counters of a run: latency histogram, responses by status, retries and throughput per
+	fixed time window. Memory does not grow with the number of records.
+	"""
+	def __init__(self, window=10):
+		self.window = window  # seconds
+		self.start = time.time()
+		self.latency = LatencyHistogram()
+		self.status_counts = collections.Counter()  # status code (or 'error') -> responses
+		self.retry_counts = collections.Counter()  # status code (or 'error') -> re-sent requests
+		self.gave_up_counts = collections.Counter()  # status code (or 'error') -> records out of retries
+		self.backoff_seconds = 0.0  # waited before re-sends
+		self.breaker_opened = 0
+		self.breaker_open_seconds = 0.0
+		self.body_bytes = 0  # request bodies, before --compress
+		self.sent_bytes = 0  # request bodies as sent
+		self.compressed_bodies = 0
+		self.compress_seconds = 0.0  # CPU time
+		self.batches = 0  # bulk requests (--batch)
+		self.batched_records = 0
+		self.in_flight = 0  # requests sent, not answered yet
+		self.limits = {}  # --adaptive: window number -> [lowest, highest, last] concurrency limit
+		self.windows = collections.Counter()  # window number -> finished records
+		self.elapsed = 0.0  # seconds from the start to the last finished record
+		# open-loop mode only: delay between scheduled and actual send, and latency from the scheduled
+		# time (corrected for coordinated omission)
+		self.send_lag = LatencyHistogram()
+		self.corrected = LatencyHistogram()
+		self._lock = threading.Lock()
+
+	def __getstate__(self):
+		# sent back from shard processes, the lock can not be pickled
+		state = self.__dict__.copy()
+		del state['_lock']
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def merge(self, other):
+		"""
+		Add the counters of another run (e.g. a shard process) to this one
+		"""
+		with self._lock:
+			self.latency.merge(other.latency)
+			self.send_lag.merge(other.send_lag)
+			self.corrected.merge(other.corrected)
+			self.status_counts.update(other.status_counts)
+			self.retry_counts.update(other.retry_counts)
+			self.gave_up_counts.update(other.gave_up_counts)
+			self.backoff_seconds += other.backoff_seconds
+			self.breaker_opened += other.breaker_opened
+			self.breaker_open_seconds += other.breaker_open_seconds
+			self.body_bytes += other.body_bytes
+			self.sent_bytes += other.sent_bytes
+			self.compressed_bodies += other.compressed_bodies
+			self.compress_seconds += other.compress_seconds
+			self.batches += other.batches
+			self.batched_records += other.batched_records
+			# limits of parallel processes add up
+			limits = self.limit_trajectory()
+			others = other.limit_trajectory()
+			for i in range(max(len(limits), len(others))):
+				mine = limits[min(i, len(limits) - 1)] if limits else [0, 0, 0]
+				theirs = others[min(i, len(others) - 1)] if others else [0, 0, 0]
+				self.limits[i] = [a + b for a, b in zip(mine, theirs)]
+			self.windows.update(other.windows)
+			self.elapsed = max(self.elapsed, other.elapsed)
+
+	def record_sent(self):
+		with self._lock:
+			self.in_flight += 1
+
+	def record_response(self, status, seconds):
+		with self._lock:
+			self.in_flight -= 1
+			self.latency.record(seconds)
+			self.status_counts[str(status)] += 1
+
+	def record_retry(self, status, delay=0.0):
+		with self._lock:
+			self.retry_counts[str(status)] += 1
+			self.backoff_seconds += delay
+
+	def record_gave_up(self, status):
+		with self._lock:
+			self.gave_up_counts[str(status)] += 1
+
+	def record_breaker(self, opened=0, open_seconds=0.0):
+		with self._lock:
+			self.breaker_opened += opened
+			self.breaker_open_seconds += open_seconds
+
+	def record_body(self, size, sent_size, compress_seconds=None):
+		"""
+		:param compress_seconds: CPU time of the compression, None if the body was not compressed
+		"""
+		with self._lock:
+			self.body_bytes += size
+			self.sent_bytes += sent_size
+			if compress_seconds is not None:
+				self.compressed_bodies += 1
+				self.compress_seconds += compress_seconds
+
+	def record_batch(self, records):
+		with self._lock:
+			self.batches += 1
+			self.batched_records += records
+
+	def record_limit(self, limit):
+		with self._lock:
+			window = int((time.time() - self.start) // self.window)
+			if window in self.limits:
+				lowest, highest, _ = self.limits[window]
+				self.limits[window] = [min(lowest, limit), max(highest, limit), limit]
+			else:
+				self.limits[window] = [limit, limit, limit]
+
+	def limit_trajectory(self):
+		"""
+		:return: [lowest, highest, last] concurrency limit of each window, a window without change keeps
+		the last limit of the window before
+		"""
+		trajectory = []
+		for i in range(max(self.limits) + 1 if self.limits else 0):
+			if i in self.limits:
+				trajectory.append(self.limits[i])
+			else:
+				last = trajectory[-1][2]
+				trajectory.append([last, last, last])
+		return trajectory
+
+	def record_send_lag(self, seconds):
+		with self._lock:
+			self.send_lag.record(seconds)
+
+	def record_done(self, scheduled=None):
+		"""
+		:param scheduled: time.perf_counter() at which the record should have been sent (open-loop mode)
+		"""
+		finished = time.perf_counter()
+		with self._lock:
+			self.elapsed = max(self.elapsed, time.time() - self.start)
+			self.windows[int(self.elapsed // self.window)] += 1
+			if scheduled is not None:
+				self.corrected.record(finished - scheduled)
+
+	def snapshot(self):
+		"""
+		:return: dictionary of the current counters, for the live metrics (MetricsExporter)
+		"""
+		with self._lock:
+			return {'in_flight': self.in_flight, 'responses': self.latency.total, 'latency_sum': self.latency.sum / 1e6,
+					'quantiles': [(q, self.latency.percentile(q * 100) / 1000.0) for q in (0.5, 0.9, 0.99)],
+					'status_counts': dict(self.status_counts), 'retries': sum(self.retry_counts.values()),
+					'records': sum(self.windows.values())}
+
+	def throughput(self):
+		"""
+		:return: list of (window start in seconds, records per second). The last window is divided by the
+		time it lasted until the last record finished, not by the full window length
+		"""
+		if not self.windows:
+			return []
+		last = max(self.windows)
+		rates = []
+		for i in range(last + 1):
+			length = self.window if i < last else max(self.elapsed - i * self.window, 0.001)
+			rates.append((i * self.window, self.windows[i] / float(length)))
+		return rates
+
+	def summary(self):
+		latency = self.latency.to_dict()
+		text = '\nLatency (ms): p50 %.1f | p90 %.1f | p99 %.1f | p99.9 %.1f | max %.1f' % \
+			   (latency['p50_ms'], latency['p90_ms'], latency['p99_ms'], latency['p99.9_ms'], latency['max_ms'])
+		if self.corrected.total:
+			latency = self.corrected.to_dict()
+			text += '\nLatency from scheduled time (ms): p50 %.1f | p90 %.1f | p99 %.1f | p99.9 %.1f | max %.1f' % \
+					(latency['p50_ms'], latency['p90_ms'], latency['p99_ms'], latency['p99.9_ms'], latency['max_ms'])
+			latency = self.send_lag.to_dict()
+			text += '\nSend lag behind schedule (ms): p50 %.1f | p99 %.1f | max %.1f' % \
+					(latency['p50_ms'], latency['p99_ms'], latency['max_ms'])
+		text += '\nResponses by status: ' + ', '.join(k + ': ' + str(v) for k, v in sorted(self.status_counts.items()))
+		text += '\nRetries: ' + (', '.join(k + ': ' + str(v) for k, v in sorted(self.retry_counts.items())) or '0')
+		if self.retry_counts:
+			text += ' | backoff %.1fs' % self.backoff_seconds
+		if self.gave_up_counts:
+			text += '\nOut of retries: ' + ', '.join(k + ': ' + str(v) for k, v in sorted(self.gave_up_counts.items()))
+		if self.compressed_bodies:
+			text += '\nRequest bodies: %.1f MB, sent %.1f MB (-%.1f%%), %d compressed, compression CPU %.2fs (%.0f us/body)' % \
+					(self.body_bytes / 1e6, self.sent_bytes / 1e6, 100.0 - self.sent_bytes * 100.0 / max(self.body_bytes, 1),
+					 self.compressed_bodies, self.compress_seconds, self.compress_seconds * 1e6 / self.compressed_bodies)
+		elif self.body_bytes:
+			text += '\nRequest bodies: %.1f MB' % (self.body_bytes / 1e6)
+		if self.batches:
+			text += '\nBulk requests: %d, %.1f records per request' % (self.batches, self.batched_records / float(self.batches))
+		if self.breaker_opened:
+			text += '\nCircuit breaker: opened %d times, sending paused %.1fs' % (self.breaker_opened, self.breaker_open_seconds)
+		text += '\nThroughput (records/s per ' + str(self.window) + 's window):'
+		for second, rate in self.throughput():
+			text += '\n  + ' + str(second) + 's: %.1f' % rate
+		if self.limits:
+			text += '\nAdaptive concurrency limit (lowest..highest, last per ' + str(self.window) + 's window):'
+			for i, (lowest, highest, last) in enumerate(self.limit_trajectory()):
+				text += '\n  + ' + str(i * self.window) + 's: ' + str(lowest) + '..' + str(highest) + ', ' + str(last)
+		return text
+
+	def to_dict(self):
+		result = {'latency': self.latency.to_dict(),
+				  'status_counts': dict(self.status_counts),
+				  'retry_counts': dict(self.retry_counts),
+				  'gave_up_counts': dict(self.gave_up_counts),
+				  'backoff_seconds': round(self.backoff_seconds, 3),
+				  'breaker_opened': self.breaker_opened,
+				  'breaker_open_seconds': round(self.breaker_open_seconds, 3),
+				  'throughput_window_seconds': self.window,
+				  'throughput': [rate for _, rate in self.throughput()]}
+		if self.body_bytes:
+			result['body_bytes'] = self.body_bytes
+			result['sent_bytes'] = self.sent_bytes
+			result['compressed_bodies'] = self.compressed_bodies
+			result['compress_cpu_seconds'] = round(self.compress_seconds, 6)
+		if self.batches:
+			result['bulk_requests'] = self.batches
+			result['bulk_records'] = self.batched_records
+		if self.limits:
+			result['concurrency_limit'] = self.limit_trajectory()
+		if self.corrected.total:
+			result['corrected_latency'] = self.corrected.to_dict()
+			result['send_lag'] = self.send_lag.to_dict()
+		return result
+
+
+class LoadProfile:
+	"""
+	Target request rate over time for the open-loop mode (--rate, --profile):
+	  constant                   : always RATE requests/second
+	  ramp:SECONDS               : grow linearly from 0 to RATE within SECONDS, then stay at RATE
+	  step:STEPS:SECONDS         : grow in STEPS equal steps, each held for SECONDS, then stay at RATE
+	  spike:FACTOR:EVERY:SECONDS : RATE, but FACTOR times RATE for SECONDS every EVERY seconds
+	"""
+	def __init__(self, rate, profile='constant'):
+		self.rate = rate
+		self.profile = profile
+		# lowest rate used, so a ramp does not wait forever for its first request
+		self.min_rate = min(max(rate / 100.0, 1.0), rate)
+		parts = profile.split(':')
+		self.kind = parts[0]
+		self.params = [float(p) for p in parts[1:]]
+		expected = {'constant': 0, 'ramp': 1, 'step': 2, 'spike': 3}
+		if self.kind not in expected or len(self.params) != expected[self.kind] or any(p <= 0 for p in self.params):
+			raise ValueError('invalid load profile: ' + profile)
+
+	def rate_at(self, elapsed):
+		"""
+		:param elapsed: seconds since the start of the run
+		:return: target requests/second at that time
+		"""
+		if self.kind == 'ramp':
+			rate = self.rate * min(elapsed / self.params[0], 1.0)
+		elif self.kind == 'step':
+			steps, length = self.params
+			rate = self.rate * min(int(elapsed // length) + 1, steps) / steps
+		elif self.kind == 'spike':
+			factor, every, length = self.params
+			rate = self.rate * factor if elapsed % every < length else self.rate
+		else:
+			rate = self.rate
+		return max(rate, self.min_rate)
+
+	def schedule(self, start):
+		"""
+		Generate the time (time.perf_counter() based) at which each request should be sent
+		:param start: time of the first request
+		"""
+		elapsed = 0.0
+		while True:
+			yield start + elapsed
+			elapsed += 1.0 / self.rate_at(elapsed)
+
+
+class Batcher:
+	"""
+	Group work queue items into lists of up to `size` items, sent as one bulk request (--batch).
+	A started batch is queued at the latest `wait` seconds after its first line was read
+	"""
+	def __init__(self, size, wait):
+		self.size = size
+		self.wait = wait
+		self.items = []
+		self._started = 0.0
+
+	def add(self, item):
+		"""
+		:return: the batch if it is full, else None
+		"""
+		if not self.items:
+			self._started = time.perf_counter()
+		self.items.append(item)
+		if len(self.items) >= self.size:
+			return self.flush()
+		return None
+
+	def deadline(self):
+		"""
+		:return: time.perf_counter() at which the started batch must be queued, None if there is none
+		"""
+		return self._started + self.wait if self.items else None
+
+	def flush(self):
+		batch, self.items = self.items, []
+		return batch
+
+
+def create_batcher():
+	"""
+	:return: Batcher in bulk mode (--batch), None else
+	"""
+	if conos_config['batch'] <= 1:
+		return None
+	return Batcher(conos_config['batch'], conos_config['batch_wait'] / 1000.0)
+
+
+def load_schedule():
+	"""
+	:return: generator of scheduled send times in open-loop mode, None in closed-loop mode
+	"""
+	if not conos_config['rate']:
+		return None
+	return LoadProfile(conos_config['rate'], conos_config['profile']).schedule(time.perf_counter())
+
+
+class PayloadSerializer:
+	"""
+	Build the compact UTF-8 JSON request body straight from the split tab fields of an input line.
+
+	The field mapping is compiled once into a %-format template, with the keys, constants and
+	punctuation already in place, plus the list of columns to fill in. serialize() then only escapes
+	the column values and fills the template. Output is the same as
+	json.dumps(prepare_inp_json(data), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+	"""
+	def __init__(self, fields):
+		self.columns = []
+		self.template = self._compile(fields).replace('%', '%%').replace('\0', '%s')
+		self._get_columns = operator.itemgetter(*self.columns)
+		self.column_count = max(self.columns) + 1  # a line with fewer columns can not be sent
+
+	def _compile(self, fields):
+		items = []
+		for key, source in fields:
+			if isinstance(source, int):
+				self.columns.append(source)
+				value = '\0'  # placeholder, the template must not contain any other NUL
+			elif isinstance(source, list):
+				value = '[' + ','.join(self._compile(nested) for nested in source) + ']'
+			else:
+				value = encode_basestring(source)
+			items.append(encode_basestring(key) + ':' + value)
+		return '{' + ','.join(items) + '}'
+
+	def serialize(self, data):
+		"""
+		:param data: the tab separated fields of an input line
+		:return: request body (bytes)
+		"""
+		return (self.template % tuple(map(encode_basestring, self._get_columns(data)))).encode('utf-8')
+
+
+class InputValidator:
+	"""
+	Pre-flight check of the input file (--validate): column count, column formats (field_formats), windows-1252
+	encoding and duplicate OBJECT_IDs. Nothing is sent.
+
+	The file is read in chunks of complete lines and each chunk is checked as a whole: one regular expression
+	of the whole line is matched against all lines (map), the chunk is decoded at once and its OBJECT_IDs are
+	checked against the ids seen so far with set operations. Only the lines which fail get split into fields,
+	to find the reasons. With more than one process the chunks are checked in a process pool, the OBJECT_IDs
+	are checked here. Rejected lines are written to the rejects file as
+	LINE_NUMBER <tab> REASONS <tab> the original line
+	"""
+	def __init__(self, fields):
+		columns = [source for _, source in fields if isinstance(source, int)]
+		for _, source in fields:
+			if isinstance(source, list):
+				columns += [column for nested in source for _, column in nested if isinstance(column, int)]
+		self.columns = max(columns) + 1
+		self.checks = []  # (column, field name, compiled format)
+		patterns = ['[^\t]*'] * self.columns
+		for name, source in fields:
+			if isinstance(source, int) and name in field_formats:
+				patterns[source] = field_formats[name]
+				self.checks.append((source, name, re.compile(field_formats[name])))
+		self._line = re.compile(('\t'.join(patterns) + '\r?').encode('ascii'))
+		self.seen = set()
+		self.lines = 0
+		self.records = 0
+		self.rejected = 0
+		self.size = 0
+		self.seconds = 0.0
+		self.reasons = collections.Counter()
+
+	def __getstate__(self):
+		# sent to the pool with every chunk: the format only, not the OBJECT_IDs seen so far
+		return {'columns': self.columns, 'checks': self.checks, '_line': self._line}
+
+	def scan(self, file_name, rejects_file, processes=1, chunk_size=8 * 1024 * 1024):
+		"""
+		Check the whole file, write the rejected lines to rejects_file
+		:return: number of rejected lines
+		"""
+		started = time.perf_counter()
+		pool = multiprocessing.Pool(processes) if processes > 1 else None
+		try:
+			with open(file_name, 'rb') as fp, open(rejects_file, 'wb') as rejects:
+				chunks = self.read_chunks(fp, chunk_size)
+				while True:
+					window = list(itertools.islice(chunks, processes * 2))  # bounded read-ahead
+					if not window:
+						break
+					results = pool.map(self.check, window) if pool is not None else map(self.check, window)
+					for chunk, result in zip(window, results):
+						self.merge(chunk, result, rejects)
+		finally:
+			if pool is not None:
+				pool.terminate()
+		self.size = os.path.getsize(file_name)
+		self.seconds = time.perf_counter() - started
+		return self.rejected
+
+	@staticmethod
+	def read_chunks(fp, chunk_size):
+		"""
+		:return: generator of chunks of complete lines, without the line end of the last one
+		"""
+		rest = b''
+		while True:
+			chunk = fp.read(chunk_size)
+			if not chunk:
+				break
+			chunk = rest + chunk
+			end = chunk.rfind(b'\n')
+			if end < 0:
+				rest = chunk
+				continue
+			rest = chunk[end + 1:]
+			yield chunk[:end]
+		if rest:
+			yield rest
+
+	def check(self, chunk):
+		"""
+		Check the lines of a chunk, in a pool process with --processes
+		:return: (OBJECT_IDs of the lines, {index of a rejected line: reasons}, number of lines, number of empty lines)
+		"""
+		lines = chunk.split(b'\n')
+		failed = set(itertools.compress(range(len(lines)), map(operator.not_, map(self._line.fullmatch, lines))))
+		try:
+			chunk.decode(encode)
+		except UnicodeDecodeError:
+			for index, line in enumerate(lines):
+				try:
+					line.decode(encode)
+				except UnicodeDecodeError:
+					failed.add(index)
+		empty = 0
+		rejected = dict()
+		for index in failed:
+			if lines[index].rstrip(b'\r'):
+				rejected[index] = self.diagnose(lines[index])
+			else:  # empty line, not sent either
+				empty += 1
+		return [line.partition(b'\t')[0] for line in lines], rejected, len(lines), empty
+
+	def merge(self, chunk, result, rejects):
+		"""
+		Find the duplicate OBJECT_IDs of a checked chunk, write its rejected lines
+		"""
+		ids, rejected, lines, empty = result
+		if len(set(ids)) != len(ids) or not self.seen.isdisjoint(ids):
+			for index, object_id in enumerate(ids):
+				if object_id in self.seen and object_id.rstrip(b'\r'):
+					rejected.setdefault(index, []).append('duplicate OBJECT_ID: ' + object_id.decode(encode, 'replace'))
+				self.seen.add(object_id)
+		else:
+			self.seen.update(ids)
+		# blank lines have no OBJECT_ID, they must not count as a distinct one
+		self.seen.discard(b'')
+		self.seen.discard(b'\r')
+		if rejected:
+			raw_lines = chunk.split(b'\n')
+			for index in sorted(rejected):
+				self.reasons.update(reason.split(':', 1)[0] for reason in rejected[index])
+				reasons = '; '.join(rejected[index]).encode(encode, 'replace')
+				rejects.write(b'%d\t%s\t%s\n' % (self.lines + index + 1, reasons, raw_lines[index].rstrip(b'\r')))
+		self.lines += lines
+		self.records += lines - empty
+		self.rejected += len(rejected)
+
+	def diagnose(self, line):
+		"""
+		:return: list of reasons why a line is rejected
+		"""
+		try:
+			fields = line.rstrip(b'\r').decode(encode).split('\t')
+		except UnicodeDecodeError as error:
+			return ['encoding: byte 0x%02x at position %d is not %s' % (line[error.start], error.start, encode)]
+		if len(fields) != self.columns:
+			return ['columns: %d, expected %d' % (len(fields), self.columns)]
+		return ['%s: %r' % (name, fields[column]) for column, name, pattern in self.checks
+				if not pattern.fullmatch(fields[column])]
+
+	def summary(self):
+		text = '\nLines: ' + str(self.lines) + \
+			   '\nRecords: ' + str(self.records) + \
+			   '\nValid: ' + str(self.records - self.rejected) + \
+			   '\nRejected: ' + str(self.rejected) + \
+			   '\nDistinct OBJECT_IDs: ' + str(len(self.seen)) + \
+			   '\nScanned: %.1f MB in %.2fs (%.0f lines/s)' % (self.size / 1e6, self.seconds,
+															  self.lines / self.seconds if self.seconds else 0)
+		if self.reasons:
+			text += '\nRejects by reason:'
+			for reason, number in self.reasons.most_common():
+				text += '\n  + %s: %d' % (reason, number)
+		return text
+
+
 # ======================================================================================================================
 # Parse input line to JSON as a request body
 def prepare_inp_json(data):
@@ -210,13 +1619,130 @@ def prepare_inp_json(data):
 #							 ENDPOINT: make requests to provided endpoint of CONOS AI Customer Update. It's value:
 #							   1: /v1.0/person
 #							   2: /v1.0/company
-#							 ENVIRONMENT: one of following values 'dev', 'test', 'int' or 'prod'
+#							 ENVIRONMENT: one of following values 'dev', 'test', 'int', 'prod' or 'local' (aicuu_mock_server.py)
 #							 CLIENT_ID: Client ID, for obtaining access token
 #							 CLIENT_SECRET: Client secret, for obtaining access token
 #							 INPUT_FILE: location of requests input file
 #							 OUTPUT_FILE: location of the output file (summary)
 #							 NUMBER_THREAD: (optional) number of threads to process data (from 1 -> 8, default is 1)')
 
+def read_options(argv):
+	"""
+	Read optional '--name=value' arguments from command line and save them to conos_config
+	:param argv: all arguments
+	:return: the remaining (positional) arguments
+	"""
+	conos_config['engine'] = 'thread'
+	conos_config['pool_size'] = 0  # 0: default of the engine
+	conos_config['keep_alive'] = 30
+	conos_config['report_file'] = None
+	conos_config['window'] = 10
+	conos_config['rate'] = 0.0  # 0: closed loop
+	conos_config['profile'] = 'constant'
+	conos_config['processes'] = 1
+	conos_config['journal_file'] = None
+	conos_config['resume'] = False
+	conos_config['result_file'] = None
+	conos_config['result_format'] = 'jsonl'
+	conos_config['retries'] = 2
+	conos_config['backoff'] = 0.5
+	conos_config['retry_statuses'] = (408, 429, 502, 503, 504)
+	conos_config['breaker'] = 0.5
+	conos_config['breaker_pause'] = 5.0
+	conos_config['adaptive'] = None  # None: fixed concurrency, 0: no latency target
+	conos_config['sync_index'] = None
+	conos_config['batch'] = 1  # records per request, > 1: bulk requests
+	conos_config['batch_wait'] = 50.0  # ms
+	conos_config['bulk_path'] = '/bulk'
+	conos_config['compress'] = None  # None, 'gzip' or 'deflate'
+	conos_config['compress_level'] = 6
+	conos_config['compress_min'] = 1024  # bytes
+	conos_config['validate'] = None  # None: send, '': validate, rejects file next to OUTPUT_FILE
+	conos_config['status_interval'] = 1.0
+	conos_config['metrics_file'] = None
+	conos_config['metrics_port'] = None
+	conos_config['shard'] = None  # index of a shard process (--processes)
+	positional = []
+	for arg in argv:
+		if not arg.startswith('--'):
+			positional.append(arg)
+			continue
+		name, _, value = arg[2:].partition('=')
+		if name == 'engine' and value in engines:
+			conos_config['engine'] = value
+		elif name == 'pool-size' and value.isdigit() and int(value) > 0:
+			conos_config['pool_size'] = int(value)
+		elif name == 'keep-alive' and value.isdigit():
+			conos_config['keep_alive'] = int(value)
+		elif name == 'report' and value:
+			conos_config['report_file'] = value
+		elif name == 'window' and value.isdigit() and int(value) > 0:
+			conos_config['window'] = int(value)
+		elif name == 'rate' and value.replace('.', '', 1).isdigit() and float(value) > 0:
+			conos_config['rate'] = float(value)
+		elif name == 'journal' and value:
+			conos_config['journal_file'] = value
+		elif name == 'result-log' and value:
+			conos_config['result_file'] = value
+			conos_config['result_format'] = 'tsv' if value.lower().endswith('.tsv') else 'jsonl'
+		elif name == 'retries' and value.isdigit():
+			conos_config['retries'] = int(value)
+		elif name == 'backoff' and value.replace('.', '', 1).isdigit():
+			conos_config['backoff'] = float(value)
+		elif name == 'retry-status' and all(code.strip().isdigit() for code in value.split(',')):
+			conos_config['retry_statuses'] = tuple(int(code) for code in value.split(','))
+		elif name == 'breaker' and value.replace('.', '', 1).isdigit() and float(value) < 1:
+			conos_config['breaker'] = float(value)
+		elif name == 'breaker-pause' and value.replace('.', '', 1).isdigit() and float(value) > 0:
+			conos_config['breaker_pause'] = float(value)
+		elif name == 'adaptive' and (not value or value.replace('.', '', 1).isdigit()):
+			conos_config['adaptive'] = float(value or 0)
+		elif name == 'sync-index' and value:
+			conos_config['sync_index'] = value
+		elif name == 'batch' and value.isdigit() and 1 <= int(value) <= max_batch:
+			conos_config['batch'] = int(value)
+		elif name == 'batch-wait' and value.replace('.', '', 1).isdigit():
+			conos_config['batch_wait'] = float(value)
+		elif name == 'bulk-path' and value.startswith('/'):
+			conos_config['bulk_path'] = value
+		elif name == 'compress' and value in ('', 'gzip', 'deflate'):
+			conos_config['compress'] = value or 'gzip'
+		elif name == 'compress-level' and value.isdigit() and 1 <= int(value) <= 9:
+			conos_config['compress_level'] = int(value)
+		elif name == 'compress-min' and value.isdigit():
+			conos_config['compress_min'] = int(value)
+		elif name == 'status-interval' and value.replace('.', '', 1).isdigit() and float(value) > 0:
+			conos_config['status_interval'] = float(value)
+		elif name == 'metrics-file' and value:
+			conos_config['metrics_file'] = value
+		elif name == 'metrics-port' and value.isdigit() and 0 < int(value) < 65536:
+			conos_config['metrics_port'] = int(value)
+		elif name == 'validate':
+			conos_config['validate'] = value
+		elif name == 'resume' and not value:
+			conos_config['resume'] = True
+		elif name == 'processes' and value.isdigit() and int(value) > 0:
+			conos_config['processes'] = int(value)
+		elif name == 'profile' and value:
+			try:
+				LoadProfile(1.0, value)
+			except ValueError:
+				print('Invalid load profile: ' + value)
+				usage()
+			conos_config['profile'] = value
+		else:
+			print('Unknown or invalid option: ' + arg)
+			usage()
+
+	if conos_config['resume'] and not conos_config['journal_file']:
+		print('--resume needs --journal=FILE')
+		usage()
+	if conos_config['engine'] == 'async' and aiohttp is None:
+		print('The asyncio engine needs the aiohttp library: pip install aiohttp')
+		sys.exit(2)
+	return positional
+
+
 def read_arguments(argv):
 	"""
 	Read 6 required arguments from command line
@@ -228,20 +1754,29 @@ def read_arguments(argv):
 	else:
 		usage()
 
-	if argv[1] in ('dev', 'test', 'int', 'prod'):
+	if argv[1] in ('dev', 'test', 'int', 'prod', 'local'):
 		conos_config['environment'] = argv[1]
 		conos_config['sts_url'] = eval(argv[1] + '_sts_url')
 		conos_config['aicuu_url'] = eval(argv[1] + '_aicuu_url')
 	else:
 		usage()
 
+	if conos_config['engine'] == 'async':
+		max_workers = max_async_requests
+	else:
+		max_workers = max_threads
 	if len(argv) == 6:
 		conos_config['number_threads'] = '1'
 	else:
-		if argv[6] in ('1', '2', '3', '4', '5', '6', '7', '8'):
+		if argv[6].isdigit() and 1 <= int(argv[6]) <= max_workers:
 			conos_config['number_threads'] = argv[6]
 		else:
 			usage()
+	if conos_config['pool_size'] == 0:
+		if conos_config['engine'] == 'async':
+			conos_config['pool_size'] = int(conos_config['number_threads'])
+		else:
+			conos_config['pool_size'] = 1
 
 	conos_config['client_id'] = argv[2]
 	conos_config['client_secret'] = argv[3]
@@ -259,13 +1794,47 @@ def usage():
 	print('\t -h             : help')
 	print('\t ENDPOINT       : 1: /v1.0/person')
 	print('\t                  2: /v1.0/company')
-	print('\t ENVIRONMENT    : must be one of: dev, test, int, prod')
+	print('\t ENVIRONMENT    : must be one of: dev, test, int, prod, local (aicuu_mock_server.py on this machine)')
 	print('\t CLIENT_ID      : used for obtaining access token')
 	print('\t CLIENT_SECRET  : used for obtaining access token')
 	print('\t INPUT_FILE     : location of the request input file')
 	print('\t OUTPUT_FILE    : location of the output file (analyze report)')
 	print('\t NUMBER_THREAD  : (optional) number of threads to process data (from 1 -> 8, default is 1)')
+	print('\t                  with --engine=async: number of concurrent requests (from 1 -> 1000, default is 1)')
+	print('\t --engine       : (optional) request engine: thread (default) or async (needs aiohttp)')
+	print('\t --pool-size    : (optional) keep-alive connections per host, per thread (thread engine, default 1)')
+	print('\t                  or in total (async engine, default NUMBER_THREAD)')
+	print('\t --keep-alive   : (optional) seconds to keep idle connections open (default 30, 0: no keep-alive)')
+	print('\t --report       : (optional) location of a JSON report (latency percentiles, status codes, throughput)')
+	print('\t --window       : (optional) throughput window of the summary in seconds (default 10)')
+	print('\t --rate         : (optional) open-loop mode: target requests per second')
+	print('\t --profile      : (optional) open-loop rate profile: constant (default), ramp:SECONDS,')
+	print('\t                  step:STEPS:SECONDS or spike:FACTOR:EVERY:SECONDS')
+	print('\t --processes    : (optional) number of processes, each sends a part of the input file (default 1)')
+	print('\t --journal      : (optional) location of a journal of finished lines, to resume an interrupted run')
+	print('\t --resume       : (optional) continue the run recorded in --journal')
+	print('\t --result-log   : (optional) location of the per-record result log (.tsv: TSV, else JSON lines)')
+	print('\t --retries      : (optional) maximum re-sends of a request (default 2)')
+	print('\t --backoff      : (optional) base wait before a re-send in seconds, doubled each time (default 0.5)')
+	print('\t --retry-status : (optional) status codes to re-send (default 408,429,502,503,504)')
+	print('\t --breaker      : (optional) error rate (0..1) that pauses sending (default 0.5, 0: off)')
+	print('\t --breaker-pause: (optional) first pause of the circuit breaker in seconds (default 5)')
+	print('\t --adaptive     : (optional) adapt the concurrency (up to NUMBER_THREAD) to errors and latency.')
+	print('\t                  --adaptive=TARGET_MS: latency target in ms (default: twice the lowest latency)')
+	print('\t --sync-index   : (optional) SQLite index of synced records: only send new or changed records')
+	print('\t --batch        : (optional) records per bulk request (1 -> 1000, default 1: no bulk requests)')
+	print('\t --batch-wait   : (optional) ms a started batch may wait for more records (default 50)')
+	print('\t --bulk-path    : (optional) path of the bulk endpoint, after the endpoint path (default /bulk)')
+	print('\t --compress     : (optional) compress request bodies: gzip (default) or deflate')
+	print('\t --compress-level: (optional) compression level 1 -> 9 (default 6)')
+	print('\t --compress-min : (optional) bodies smaller than this many bytes are not compressed (default 1024)')
+	print('\t --status-interval: (optional) seconds between refreshes of the status line and metrics (default 1)')
+	print('\t --metrics-file : (optional) Prometheus textfile with the live metrics, rewritten every refresh')
+	print('\t --metrics-port : (optional) serve the live metrics on http://127.0.0.1:PORT/metrics')
+	print('\t --validate     : (optional) only check INPUT_FILE, send nothing. --validate=FILE: location of the')
+	print('\t                  rejected lines (default OUTPUT_FILE.rejects)')
 	print('\n\t Example        : python conos_aicuu_client.py 1 test Admin 123456 data/person/input.txt data/person/output.txt 5')
+	print('\t                  python conos_aicuu_client.py 1 test Admin 123456 data/person/input.txt data/person/output.txt 300 --engine=async')
 	exit(2)
 
 
@@ -283,130 +1852,1045 @@ def total_time(diff):
 
 class AicuuThread(threading.Thread):
 	def __init__(self, threadID, name, q):
-		threading.Thread.__init__(self)
+		# daemon: an interrupted run (Ctrl-C) must not wait for the threads
+		threading.Thread.__init__(self, daemon=True)
 		self.threadID = threadID
 		self.name = name
 		self.q = q
 	def run(self):
-		make_request(self.name, self.q)
+		global worker_aborted
+		try:
+			make_request(self.name, self.q)
+		except SystemExit:  # e.g. got status 403, only ends this thread
+			worker_aborted = True
 
 
-def make_request(threadName, q):
+class Forbidden(Exception):
+	"""
+	Got status 403 in the asyncio engine: run_async_engine() stops all workers
+	"""
+
+
+def check_status(status_code, line):
+	"""
+	Apply the AICUU response rules to a status code. Shared by the thread and the asyncio engine
+	:param status_code: HTTP status code of the response
+	:param line: input line of the request, for logging
+	:return: 'success', 'token_expired' (re-obtain token, then re-send), 'retry' (re-send), 'failed' or
+	'forbidden' (stop: the worker thread ends, the asyncio engine stops the run)
+	"""
+	if status_code == 200: # success
+		return 'success'
+	elif status_code == 401: # Invalid token, need to re-obtain
+		tmp_log = '\nToken expired. Try to get a new one '
+		print(tmp_log)
+		log_console('\n' + tmp_log)
+		return 'token_expired'
+	elif status_code == 403: # Forbidden
+		tmp_log = '\nForbidden. Access denied for user ' + conos_config['client_id']
+		print(tmp_log)
+		log_console('\n' + tmp_log)
+		flush_console()
+		return 'forbidden'
+	elif status_code in retry_policy.statuses:  # try again
+		# 408 <-The operation timed out
+		# 502 <-Bad gateway
+		# default: also 429, 503 and 504, see --retry-status
+		log_console('\n\nGot status ' + str(status_code) + '. Try to re-send request: ' + line)
+		return 'retry'
+	else:
+		tmp_log = '\nGot status ' + str(status_code) + ' for this request: ' + line
+		print(tmp_log)
+		log_console(tmp_log)
+		return 'failed'
+
+
+def log_console(text):
+	"""
+	Append text to the console log, from any thread. Once the log is larger than console_spill_size it is
+	written to the output file, so it does not grow for the whole run nor get copied over and over
+	"""
 	global console
-	global queueLock
-	global openQueue
-	global count
+	with consoleLock:
+		console += text
+		if target is not None and len(console) >= console_spill_size:
+			write_output()
+			console = ''
+
+
+def flush_console():
+	"""
+	Write the console log to the output file now
+	"""
+	global console
+	with consoleLock:
+		if target is not None:
+			write_output()
+			console = ''
+
+
+def skip_unchanged(offset, object_id):
+	"""
+	Account for a record not sent because it did not change since the last sync (--sync-index)
+	"""
+	global unchanged
+	with counterLock:
+		unchanged += 1
+	if result_writer is not None:
+		result_writer.put(offset, object_id, 'unchanged', 0.0, 0, b'')
+	if journal is not None:
+		journal.finished(offset, True)
+	show_progress(offset)
+
+
+def reject_record(offset, arr, line):
+	"""
+	Account for a line that can not be sent (too few columns): failed, logged, not sent again with --resume
+	"""
+	tmp_log = '\nInvalid line, %d columns instead of %d, not sent: %s' % (len(arr), serializer.column_count, line.strip('\n'))
+	print(tmp_log)
+	log_console(tmp_log)
+	if result_writer is not None:
+		result_writer.put(offset, arr[0], 'invalid', 0.0, 0, b'')
+	if journal is not None:
+		journal.finished(offset, True)
+	show_progress(offset)
+
+
+def fail_items(items, error):
+	"""
+	Account for queued lines whose processing raised an unexpected error: failed, logged, re-sent with --resume.
+	The worker goes on with the next lines
+	"""
+	for offset, line, _ in items:
+		if len(line) <= 1:
+			continue
+		tmp_log = '\nError %r, record failed: %s' % (error, line.strip('\n'))
+		print(tmp_log)
+		log_console(tmp_log)
+		if result_writer is not None:
+			result_writer.put(offset, line.split('\t', 1)[0], 'error', 0.0, 0, b'')
+		if journal is not None:
+			journal.finished(offset, False)
+		show_progress(offset)
+
+
+def prepare_records(items):
+	"""
+	Split and serialize queued lines. Empty lines, lines with too few columns and records unchanged since the
+	last sync (--sync-index) are finished here
+	:param items: list of (offset, line, scheduled) from the work queue
+	:return: list of (offset, fields, scheduled, payload hash or None, request body) to send
+	"""
+	records = []
+	for offset, line, scheduled in items:
+		if len(line) <= 1:  # empty line still have character \n
+			if journal is not None:
+				journal.finished(offset, True)
+			continue
+		arr = line.strip('\n').split('\t')  # strip('\n'): remove \n at the end of each line
+		if len(arr) < serializer.column_count:
+			reject_record(offset, arr, line)
+			continue
+		data = serializer.serialize(arr)
+		digest = None
+		if sync_index is not None:
+			digest = sync_index.digest(data)
+			if sync_index.unchanged(arr[0], digest):
+				skip_unchanged(offset, arr[0])
+				continue
+		records.append((offset, arr, scheduled, digest, data))
+	return records
+
+
+def bulk_body(records):
+	"""
+	Request body of a bulk request (--batch): JSON array of the records
+	"""
+	return b'[' + b','.join(record[4] for record in records) + b']'
+
+
+def bulk_description(records):
+	"""
+	Bulk request description for logging
+	"""
+	return 'bulk request of ' + str(len(records)) + ' records, OBJECT_ID ' + records[0][1][0] + ' to ' + \
+		   records[-1][1][0] + '\n'
+
+
+def bulk_results(records, status_code, body):
+	"""
+	Map the response of a bulk request (--batch) back to its records. With status 200 the body is a JSON array
+	with one result {"OBJECT_ID": ..., "STATUS": ...} per record, in request order. Any other final status
+	(or no response) applies to every record of the request
+	:return: list of (status code, result body) of each record
+	"""
+	if status_code != 200:
+		return [(status_code, body)] * len(records)
+	try:
+		results = json.loads(body.decode('utf-8'))
+		if len(results) != len(records):
+			raise ValueError('%d results for %d records' % (len(results), len(records)))
+		mapped = []
+		for record, result in zip(records, results):
+			if str(result['OBJECT_ID']) != record[1][0]:
+				raise ValueError('result of OBJECT_ID %s in place of %s' % (result['OBJECT_ID'], record[1][0]))
+			mapped.append((int(result.get('STATUS', 200)), json.dumps(result, ensure_ascii=False).encode('utf-8')))
+	except (ValueError, TypeError, KeyError, AttributeError) as e:
+		tmp_log = '\nInvalid bulk response (' + str(e) + '). ' + str(len(records)) + ' records counted as failed'
+		print(tmp_log)
+		log_console(tmp_log)
+		return [(None, body)] * len(records)
+	for record, (status, _) in zip(records, mapped):
+		if status != 200:
+			tmp_log = '\nGot status ' + str(status) + ' for this record: ' + '\t'.join(record[1])
+			print(tmp_log)
+			log_console(tmp_log)
+	return mapped
+
+
+def finish_records(records, results, seconds, retries):
+	"""
+	Account for sent records: success counter, sync index, statistics, result log, journal and progress
+	:param records: from prepare_records()
+	:param results: (final status code or None, response body) of each record
+	:param seconds: time since the first attempt
+	:param retries: re-sends of the request
+	"""
 	global success
-	global headers
-	while not exitFlag:
-		if openQueue:
-			queueLock.acquire()
-		else:
+	ok = 0
+	for (offset, arr, scheduled, digest, _), (status_code, body) in zip(records, results):
+		if status_code == 200:
+			ok += 1
+			if sync_index is not None:
+				sync_index.synced(arr, digest)
+		stats.record_done(scheduled)
+		if result_writer is not None:
+			result_writer.put(offset, arr[0], status_code, seconds, retries, body)
+		if journal is not None:
+			journal.finished(offset, is_finished(status_code))
+	with counterLock:
+		success += ok
+	show_progress(records[-1][0])
+
+
+def record_send_lag(records):
+	"""
+	Open-loop mode (--rate): add the delay between the scheduled and the actual send time of the records.
+	Called right before the first attempt, after the circuit breaker and the adaptive limit let it go
+	:param records: from prepare_records()
+	"""
+	now = time.perf_counter()
+	for record in records:
+		if record[2] is not None:
+			stats.record_send_lag(now - record[2])
+
+
+def post(target_url, data, line, records=()):
+	"""
+	Send one request with the requests session of this thread
+	if token expired, re-obtain token, then make request again
+	if request time-out, bad gateway (502) or no response, re-send after a backoff (retry_policy)
+	:param line: what is sent, for logging
+	:param records: the records of the request, for the send lag (record_send_lag())
+	:return: (final status code or None, response body, attempts)
+	"""
+	attempts = 0
+	retries = 0
+	status_code = None
+	body = b''
+	content_encoding = None
+	if compressor is not None:
+		data, content_encoding = compressor.compress(data)
+	else:
+		stats.record_body(len(data), len(data))
+	while True:
+		request_header = request_headers()
+		if content_encoding is not None:
+			request_header['Content-Encoding'] = content_encoding
+		probe = False
+		if breaker is not None:
+			probe = breaker.wait()
+		if limiter is not None:
+			limiter.acquire()
+		retry_after = None
+		status_code = None
+		started = time.perf_counter()
+		try:
+			attempts += 1
+			if attempts == 1:
+				record_send_lag(records)
+			stats.record_sent()
+			try:
+				response = get_session().post(url=target_url, data=data, headers=request_header, timeout=90)  # 90 seconds
+			except requests.exceptions.RequestException as e:
+				stats.record_response('error', time.perf_counter() - started)
+				print('Root cause: ', e)
+				status = 'retry' if retry_policy.retryable_error(e) else 'failed'
+			else:
+				stats.record_response(response.status_code, time.perf_counter() - started)
+				status_code = response.status_code
+				body = response.content
+				retry_after = response.headers.get('Retry-After')
+				# response.encoding = encode
+				status = check_status(response.status_code, line)
+		finally:  # also on an unexpected error: the other threads wait for the slot or the probe
+			if limiter is not None:
+				limiter.release(status_code, time.perf_counter() - started)
+			if breaker is not None:
+				breaker.record(status_code, probe)
+		if status == 'forbidden':
+			sys.exit(1)  # ends this worker thread, see AicuuThread
+		if status == 'token_expired':  # Invalid token, need to re-obtain
+			token_manager.refresh(request_header['Authorization'])
 			continue
-		if not workQueue.empty():
-			line = q.get()
-			queueLock.release()
-			count += 1
-			if len(line) <= 1:  # empty line still have character \n
+		elif status == 'retry':
+			if retries < retry_policy.max_retries:
+				retries += 1
+				delay = retry_policy.delay(retries, retry_after)
+				stats.record_retry(status_code or 'error', delay)
+				time.sleep(delay)
 				continue
-			arr = line.strip('\n').split('\t')  # strip('\n'): remove \n at the end of each line
-			payload = prepare_inp_json(arr)
-			token_expired = True
-			should_retry = True
-			retry_times = 0
-			# if token expired, re-obtain token, then make request again
-			# if request time-out, or bad gateway (502), try re-send 2 times
-			while token_expired or (should_retry and retry_times <= 2):
-				try:
-					response = requests.post(url=url, data=json.dumps(payload, ensure_ascii=False, indent=4).encode('utf-8'), headers=headers, timeout=90)  # 90 seconds
-					token_expired = False
-					should_retry = False
-					# response.encoding = encode
-					status_code = response.status_code
-					if status_code == 200: # success
-						success += 1
-					elif status_code == 401: # Invalid token, need to re-obtain
-						tmp_log = '\nToken expired. Try to get a new one '
-						print(tmp_log)
-						console += '\n' + tmp_log
-						token_expired = True
-						headers['Authorization'] = obtain_access_token()
-					elif status_code == 403: # Forbidden
-						tmp_log = '\nForbidden. Access denied for user ' + conos_config['client_id']
-						print(tmp_log)
-						console += '\n' + tmp_log
-						write_output()
-						console = ''
-						sys.exit(1)
-					elif status_code in [408, 502]:  # try again
-						# 408 <-The operation timed out
-						# 502 <-Bad gateway
-						should_retry = True
-						retry_times += 1
-						#print(tmp_log)
-						console += '\n\nGot status ' + str(status_code) + '. Try to re-send request: ' + line
-					else:
-						tmp_log = '\nGot status ' + str(status_code) + ' for this request: ' + line
-						print(tmp_log)
-						console += tmp_log
-						response.raise_for_status()
-				except requests.exceptions.RequestException as e:
-					print('Root cause: ', e)
-				#sys.exit(1)
-			sys.stdout.write("\rDONE %.3f%%" % (float(count) * 100 / float(num_lines)))
-			sys.stdout.flush()
+			stats.record_gave_up(status_code or 'error')
+		return status_code, body, attempts
+
+
+def make_request(threadName, q):
+	while True:
+		item = q.get()  # wait while the queue is empty
+		if item is None:  # end of input
+			break
+		batch = isinstance(item, list)  # --batch
+		try:
+			records = prepare_records(item if batch else [item])
+			if not records:
+				continue
+			started = time.perf_counter()
+			if batch:
+				stats.record_batch(len(records))
+				status_code, body, attempts = post(bulk_url, bulk_body(records), bulk_description(records), records)
+				results = bulk_results(records, status_code, body)
+			else:
+				status_code, body, attempts = post(url, records[0][4], item[1], records)
+				results = [(status_code, body)]
+			finish_records(records, results, time.perf_counter() - started, attempts - 1)
+		except Exception as e:  # one bad record must not end the thread
+			fail_items(item if batch else [item], e)
+
+
+async def async_post(session, target_url, data, line, records=()):
+	"""
+	asyncio counterpart of post(): same rules, with the shared aiohttp session
+	:param records: the records of the request, for the send lag (record_send_lag())
+	:return: (final status code or None, response body, attempts)
+	"""
+	loop = asyncio.get_running_loop()
+	timeout = aiohttp.ClientTimeout(total=90)  # 90 seconds
+	attempts = 0
+	retries = 0
+	status_code = None
+	body = b''
+	content_encoding = None
+	if compressor is None:
+		stats.record_body(len(data), len(data))
+	elif len(data) >= compressor.offload_size:
+		# zlib releases the GIL: large (bulk) bodies are compressed in a thread while other requests go on
+		data, content_encoding = await loop.run_in_executor(None, compressor.compress, data)
+	else:
+		data, content_encoding = compressor.compress(data)
+	while True:
+		request_header = request_headers()
+		if content_encoding is not None:
+			request_header['Content-Encoding'] = content_encoding
+		probe = False
+		if breaker is not None:
+			probe = await breaker.async_wait()
+		if limiter is not None:
+			await limiter.async_acquire()
+		retry_after = None
+		status_code = None
+		started = time.perf_counter()
+		try:
+			attempts += 1
+			if attempts == 1:
+				record_send_lag(records)
+			stats.record_sent()
+			try:
+				async with session.post(target_url, data=data, headers=request_header, timeout=timeout) as response:
+					body = await response.read()
+			except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+				stats.record_response('error', time.perf_counter() - started)
+				print('Root cause: ', e)
+				status = 'retry' if retry_policy.retryable_error(e) else 'failed'
+			else:
+				stats.record_response(response.status, time.perf_counter() - started)
+				status_code = response.status
+				retry_after = response.headers.get('Retry-After')
+				status = check_status(response.status, line)
+		finally:  # also when the task is cancelled
+			if limiter is not None:
+				await limiter.async_release(status_code, time.perf_counter() - started)
+			if breaker is not None:
+				breaker.record(status_code, probe)
+		if status == 'forbidden':
+			raise Forbidden(line)
+		if status == 'token_expired':
+			# refresh() is blocking, keep it off the event loop
+			await loop.run_in_executor(None, token_manager.refresh, request_header['Authorization'])
+			continue
+		elif status == 'retry':
+			if retries < retry_policy.max_retries:
+				retries += 1
+				delay = retry_policy.delay(retries, retry_after)
+				stats.record_retry(status_code or 'error', delay)
+				await asyncio.sleep(delay)
+				continue
+			stats.record_gave_up(status_code or 'error')
+		return status_code, body, attempts
+
+
+async def async_make_request(session, q):
+	"""
+	asyncio counterpart of make_request(): take lines from the queue until the end-of-input marker (None)
+	and send them with the shared aiohttp session. With --sync-index or --journal the records are prepared and
+	finished in the default executor, so SQLite queries and the journal fsync do not block the event loop
+	"""
+	loop = asyncio.get_running_loop()
+	blocking = sync_index is not None or journal is not None
+	while True:
+		item = await q.get()
+		if item is None:
+			break
+		batch = isinstance(item, list)  # --batch
+		try:
+			if blocking:
+				records = await loop.run_in_executor(None, prepare_records, item if batch else [item])
+			else:
+				records = prepare_records(item if batch else [item])
+			if not records:
+				continue
+			started = time.perf_counter()
+			if batch:
+				stats.record_batch(len(records))
+				status_code, body, attempts = await async_post(session, bulk_url, bulk_body(records),
+															   bulk_description(records), records)
+				results = bulk_results(records, status_code, body)
+			else:
+				status_code, body, attempts = await async_post(session, url, records[0][4], item[1], records)
+				results = [(status_code, body)]
+			if blocking:
+				await loop.run_in_executor(None, finish_records, records, results, time.perf_counter() - started,
+										   attempts - 1)
+			else:
+				finish_records(records, results, time.perf_counter() - started, attempts - 1)
+		except Forbidden:
+			raise
+		except Exception as e:  # one bad record must not end the whole run (asyncio.gather)
+			fail_items(item if batch else [item], e)
+
+
+async def async_create_queue(q, number_workers, start=0, end=None):
+	"""
+	Feed the input file to the asyncio queue. The queue is bounded, so reading waits while it is full.
+	In open-loop mode (--rate) each line is put at its scheduled time.
+	One end-of-input marker (None) is put per worker
+	"""
+	global count
+	schedule = load_schedule()
+	batcher = create_batcher()
+	for offset, line in read_work(start, end):
+		count += 1
+		scheduled = None
+		if schedule is not None:
+			scheduled = next(schedule)
+			if batcher is not None and batcher.deadline() is not None and batcher.deadline() < scheduled:
+				# do not keep a started batch longer than --batch-wait
+				delay = batcher.deadline() - time.perf_counter()
+				if delay > 0:
+					await asyncio.sleep(delay)
+				await q.put(batcher.flush())
+			delay = scheduled - time.perf_counter()
+			if delay > 0:
+				await asyncio.sleep(delay)
+		item = (offset, line, scheduled)
+		if batcher is not None:
+			item = batcher.add(item)
+			if item is None:
+				continue
+		await q.put(item)
+	if batcher is not None and batcher.items:
+		await q.put(batcher.flush())
+	for _ in range(number_workers):
+		await q.put(None)
+
+
+async def run_async_engine(start=0, end=None):
+	"""
+	Run all requests with the asyncio engine: NUMBER_THREAD coroutines share one aiohttp session
+	:param start, end: byte range of the input file to send (whole file by default)
+	"""
+	number_workers = int(conos_config['number_threads'])
+	q = asyncio.Queue(maxsize=queue_size)
+	if metrics is not None:
+		metrics.queue = q
+	if conos_config['keep_alive'] == 0:
+		connector = aiohttp.TCPConnector(limit=conos_config['pool_size'], force_close=True)
+	else:
+		connector = aiohttp.TCPConnector(limit=conos_config['pool_size'], keepalive_timeout=conos_config['keep_alive'])
+
+	# count new and reused connections, like connection_stats() does for the requests sessions
+	async def on_connection_create_end(session, context, params):
+		global connections_opened
+		connections_opened += 1
+
+	async def on_connection_reuseconn(session, context, params):
+		global connections_reused
+		connections_reused += 1
+
+	trace_config = aiohttp.TraceConfig()
+	trace_config.on_connection_create_end.append(on_connection_create_end)
+	trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+	async with aiohttp.ClientSession(connector=connector, trace_configs=[trace_config]) as session:
+		global worker_aborted
+		workers = [asyncio.ensure_future(async_make_request(session, q)) for _ in range(number_workers)]
+		reader = asyncio.ensure_future(async_create_queue(q, number_workers, start, end))
+		try:
+			await asyncio.gather(reader, *workers)
+		except Forbidden:  # the lines in flight are not finished, --resume sends them again
+			worker_aborted = True
+			for task in [reader] + workers:
+				task.cancel()
+			await asyncio.gather(reader, *workers, return_exceptions=True)
+
+
+def read_lines(start=0, end=None):
+	"""
+	Read the lines of the input file which start in the byte range [start, end), as (byte offset of the line,
+	line). uid_check/GetByUID_ws_client.py has a copy with the same offsets, both scripts are run on their own
+	:param start: byte offset of the first line, must be the start of a line
+	:param end: byte offset where to stop, None: end of file
+	"""
+	with open(data_file_name, "rb", buffering=0) as fp:
+		fp.seek(start)
+		position = start
+		rest = b''  # incomplete last line of the previous chunk
+		while end is None or position < end:
+			chunk = fp.read(read_chunk_size)
+			if not chunk:
+				break
+			lines = (rest + chunk).split(b'\n')
+			rest = lines.pop()
+			for raw in lines:
+				if end is not None and position >= end:
+					return
+				offset = position
+				position += len(raw) + 1
+				if raw.endswith(b'\r'):
+					raw = raw[:-1]
+				yield offset, raw.decode(encode) + '\n'
+		if rest and (end is None or position < end):  # last line without \n
+			yield position, rest.rstrip(b'\r').decode(encode)
+
+
+def read_work(start=0, end=None):
+	"""
+	Read the lines to send, as (offset, line). When resuming, lines recorded as failed are re-sent first,
+	then reading starts at the journal watermark and skips lines already finished
+	:param start, end: byte range of the input file (whole file by default)
+	"""
+	if journal is None:
+		for item in read_lines(start, end):
+			yield item
+		return
+	with open(data_file_name, "rb") as fp:
+		for offset in sorted(journal.failed):
+			if offset >= start and (end is None or offset < end):
+				fp.seek(offset)
+				journal.dispatched(offset)
+				yield offset, fp.readline().replace(b'\r\n', b'\n').decode(encode)
+	for offset, line in read_lines(max(start, journal.watermark), end):
+		if offset in journal.done:
+			journal.skipped += 1
+			continue
+		journal.dispatched(offset)
+		yield offset, line
+	journal.end_of_input(end if end is not None else os.path.getsize(data_file_name))
+
+
+def split_shards(file_name, number_shards):
+	"""
+	Split a file into byte ranges of about the same size. Every range starts at the beginning of a line
+	:return: list of (start, end) byte offsets
+	"""
+	size = os.path.getsize(file_name)
+	bounds = [0]
+	with open(file_name, "rb") as fp:
+		for i in range(1, number_shards):
+			position = size * i // number_shards
+			if position <= bounds[-1]:
+				continue
+			fp.seek(position - 1)
+			fp.readline()  # move to the start of the next line
+			if fp.tell() < size and fp.tell() > bounds[-1]:
+				bounds.append(fp.tell())
+	bounds.append(size)
+	return list(zip(bounds[:-1], bounds[1:]))
+
+
+def shard_file_name(file_name, shard):
+	"""
+	Name of the file of one shard process: FILE.ext -> FILE.shardN.ext, keeps the extension
+	"""
+	root, extension = os.path.splitext(file_name)
+	return root + '.shard' + str(shard) + extension
+
+
+def init_shard(status):
+	"""
+	Initializer of the shard processes
+	:param status: ShardStatus shared with the main process
+	"""
+	global shard_status
+	shard_status = status
+
+
+def run_shard(config, start, end):
+	"""
+	Send the lines of one byte range of the input file. Runs in its own process, with its own
+	connections, access token and statistics. Its console log spills to its own file, copied
+	into the output file by run_shards()
+	:return: dictionary with the results of the shard, merged by run_shards()
+	"""
+	global target
+	global progress
+	conos_config.update(config)
+	progress = ProgressReporter(end - start, start)
+	init_requests()
+	target = open(shard_file_name(conos_config['output_file'], conos_config['shard']), "w", encoding=encode)
+	aborted = False
+	try:
+		if conos_config['engine'] == 'async':
+			asyncio.run(run_async_engine(start, end))
 		else:
-			openQueue = False
-			queueLock.release()
+			create_threads()
+			create_queue(start, end)
+			for t in threads:
+				t.join()
+		aborted = worker_aborted  # a worker got status 403
+	except (SystemExit, KeyboardInterrupt):  # e.g. no access token
+		aborted = True
+	finally:
+		if journal is not None:
+			journal.close()
+		if result_writer is not None:
+			result_writer.close()
+		if sync_index is not None:
+			sync_index.close()
+	if breaker is not None:
+		breaker.stop()
+	if not aborted:
+		progress.update(end)
+	if metrics is not None:
+		metrics.stop()
+	token_manager.stop()
+	flush_console()
+	target.close()
+	opened, reused = connection_stats()
+	return {'count': count, 'success': success, 'aborted': aborted, 'console_file': target.name, 'stats': stats,
+			'skipped': journal.skipped if journal is not None else 0, 'unchanged': unchanged,
+			'connections_opened': opened, 'connections_reused': reused,
+			'access_tokens': token_manager.refresh_count}
 
 
-def create_threads():
+def run_shards():
+	"""
+	Split the input file into byte ranges and send each one from its own process (--processes).
+	The results of all processes are merged into the counters of this process
+	"""
 	global console
+	global count
+	global success
+	global connections_opened
+	global connections_reused
+	global skipped
+	global unchanged
+	shards = split_shards(data_file_name, conos_config['processes'])
+	config = dict(conos_config)
+	config['processes'] = 1
+	config['rate'] = conos_config['rate'] / len(shards)
+
+	# spawn: do not fork this process while its token refresher thread is running
+	context = multiprocessing.get_context('spawn')
+	status = ShardStatus(len(shards), os.path.getsize(data_file_name), context)
+	with context.Pool(len(shards), init_shard, (status,)) as pool:
+		results = []
+		for i, (start, end) in enumerate(shards):
+			if conos_config['journal_file']:  # one journal per shard
+				config['journal_file'] = conos_config['journal_file'] + '.shard' + str(i)
+			if conos_config['result_file']:  # one result log per shard, keeps the .tsv of the TSV format
+				config['result_file'] = shard_file_name(conos_config['result_file'], i)
+			if conos_config['metrics_file']:  # one metrics file per shard, keeps the .prom of the textfile collector
+				config['metrics_file'] = shard_file_name(conos_config['metrics_file'], i)
+			if conos_config['metrics_port']:  # one port per shard
+				config['metrics_port'] = conos_config['metrics_port'] + i
+			config['shard'] = i
+			results.append(pool.apply_async(run_shard, (dict(config), start, end)))
+		running = results
+		while running:
+			running[0].wait(conos_config['status_interval'])
+			running = [result for result in running if not result.ready()]
+			status.refresh(len(results) - len(running))
+		for i, result in enumerate(results):
+			shard = result.get()
+			count += shard['count']
+			skipped += shard['skipped']
+			unchanged += shard['unchanged']
+			success += shard['success']
+			connections_opened += shard['connections_opened']
+			connections_reused += shard['connections_reused']
+			token_manager.refresh_count += shard['access_tokens']
+			stats.merge(shard['stats'])
+			flush_console()
+			with open(shard['console_file'], encoding=encode) as fp:  # console log of the shard, in shard order
+				shutil.copyfileobj(fp, target)
+			target.flush()
+			os.remove(shard['console_file'])
+			print('\nShard ' + str(i + 1) + '/' + str(len(shards)) + ' finished. Success: ' + str(shard['success']))
+			if shard['aborted']:
+				write_output()
+				console = ''
+				sys.exit(1)
+
+
+class ProgressReporter:
+	"""
+	Progress from the byte offset of the last finished record of the input file, or of the byte range of a
+	shard process. Workers only store the offset, the status line of MetricsExporter shows it as 'DONE x%'
+	"""
+	def __init__(self, total_bytes, start=0):
+		self.total_bytes = max(total_bytes, 1)
+		self.start = start  # first byte of the range of a shard process
+		self.position = start
+
+	def update(self, position):
+		self.position = position
+
+	def done(self):
+		"""
+		:return: bytes of the range before the last finished record
+		"""
+		return min(max(self.position - self.start, 0), self.total_bytes)
+
+	def percent(self):
+		return self.done() * 100.0 / self.total_bytes
+
+
+class ShardStatus:
+	"""
+	Progress of the shard processes (--processes) in shared memory: the MetricsExporter of each shard stores its
+	bytes done, responses and requests in flight, the main process shows their sum as one status line
+	"""
+	fields = 3  # bytes done, responses, requests in flight
+
+	def __init__(self, shards, total_bytes, context):
+		self.shards = shards
+		self.total_bytes = max(total_bytes, 1)
+		self.values = context.Array('d', shards * self.fields)
+		self.rps = 0.0
+		self._last = (time.perf_counter(), 0)
+		self._status_width = 0
+
+	def update(self, shard, done, responses, in_flight):
+		with self.values.get_lock():
+			self.values[shard * self.fields:(shard + 1) * self.fields] = [done, responses, in_flight]
+
+	def refresh(self, finished):
+		"""
+		Show the status line of all the shards
+		:param finished: number of shard processes finished
+		"""
+		with self.values.get_lock():
+			values = self.values[:]
+		done, responses, in_flight = (sum(values[i::self.fields]) for i in range(self.fields))
+		now = time.perf_counter()
+		last_time, last_responses = self._last
+		if now > last_time:
+			self.rps = (responses - last_responses) / (now - last_time)
+		self._last = (now, responses)
+		line = 'DONE %.3f%% | %.1f req/s | in flight %d | shards finished %d/%d' % (
+			min(done, self.total_bytes) * 100.0 / self.total_bytes, self.rps, in_flight, finished, self.shards)
+		sys.stdout.write('\r' + line.ljust(self._status_width))
+		sys.stdout.flush()
+		self._status_width = len(line)
+
+
+class MetricsExporter:
+	"""
+	Live view of a running test, refreshed every `interval` seconds by a background thread, not on every
+	request: a status line on the console (progress, requests/s, requests in flight, queue depth, responses by
+	status, latency) and the metrics in Prometheus text format, rewritten to `file_name` for the node exporter
+	textfile collector and served on http://127.0.0.1:`port`/metrics
+	"""
+	def __init__(self, interval=1.0, file_name=None, port=None, labels=''):
+		self.interval = interval
+		self.file_name = file_name
+		self.labels = labels  # e.g. shard="0" in the shard processes
+		self.queue = None  # the work queue, for its depth
+		self.rps = 0.0  # responses per second over the last interval
+		self._last = (time.perf_counter(), 0)
+		self._status_width = 0
+		self._stop = threading.Event()
+		self._thread = None
+		self._server = None
+		if port:
+			self._server = http.server.ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+			self._server.daemon_threads = True
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name='MetricsExporter', daemon=True)
+		self._thread.start()
+		if self._server is not None:
+			threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True).start()
+
+	def stop(self):
+		"""
+		Stop refreshing, after a last refresh with the final counters
+		"""
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+		self.refresh()
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			self.refresh()
+
+	def refresh(self):
+		snapshot = stats.snapshot()
+		now = time.perf_counter()
+		last_time, last_responses = self._last
+		if now > last_time:
+			self.rps = (snapshot['responses'] - last_responses) / (now - last_time)
+		self._last = (now, snapshot['responses'])
+		if self.file_name:
+			# the collector must never read a half written file
+			with open(self.file_name + '.tmp', 'w') as fp:
+				fp.write(self.render(snapshot))
+			os.replace(self.file_name + '.tmp', self.file_name)
+		if shard_status is not None:  # shard process, the main process shows the status line
+			shard_status.update(conos_config['shard'], progress.done(), snapshot['responses'], snapshot['in_flight'])
+		elif progress is not None:
+			line = self.status_line(snapshot)
+			sys.stdout.write('\r' + line.ljust(self._status_width))
+			sys.stdout.flush()
+			self._status_width = len(line)
+
+	def status_line(self, snapshot):
+		quantiles = dict(snapshot['quantiles'])
+		line = 'DONE %.3f%% | %.1f req/s | in flight %d' % (progress.percent(), self.rps, snapshot['in_flight'])
+		if self.queue is not None:
+			line += ' | queued %d' % self.queue.qsize()
+		if snapshot['status_counts']:
+			line += ' | ' + ', '.join(k + ': ' + str(v) for k, v in sorted(snapshot['status_counts'].items()))
+		return line + ' | p50 %.1f p99 %.1f ms' % (quantiles[0.5] * 1000, quantiles[0.99] * 1000)
+
+	def render(self, snapshot=None):
+		"""
+		:return: the metrics in Prometheus text format
+		"""
+		if snapshot is None:
+			snapshot = stats.snapshot()
+		records = snapshot['records']
+		metrics = [('aicuu_requests_in_flight', 'gauge', 'Requests sent and not answered yet',
+					[('', snapshot['in_flight'])]),
+				   ('aicuu_responses_total', 'counter', 'Responses by status code, error: no response',
+					[('status="%s"' % status, number) for status, number in sorted(snapshot['status_counts'].items())]),
+				   ('aicuu_retries_total', 'counter', 'Re-sent requests', [('', snapshot['retries'])]),
+				   ('aicuu_records_total', 'counter', 'Finished records by result',
+					[('result="success"', success), ('result="failed"', max(records - success, 0)),
+					 ('result="unchanged"', unchanged)]),
+				   ('aicuu_requests_per_second', 'gauge', 'Responses per second over the last %gs' % self.interval,
+					[('', round(self.rps, 3))]),
+				   ('aicuu_request_latency_seconds', 'summary', 'Request latency since the start of the run',
+					[('quantile="%g"' % q, round(seconds, 6)) for q, seconds in snapshot['quantiles']])]
+		if self.queue is not None:
+			metrics.append(('aicuu_queue_depth', 'gauge', 'Work queue items waiting for a worker',
+							[('', self.queue.qsize())]))
+		if limiter is not None:
+			metrics.append(('aicuu_concurrency_limit', 'gauge', 'Adaptive concurrency limit', [('', limiter.limit)]))
+		if progress is not None:
+			metrics.append(('aicuu_progress_ratio', 'gauge', 'Offset of the last finished record, as a part of the input file',
+							[('', round(progress.percent() / 100.0, 6))]))
+		text = ''
+		for name, kind, description, samples in metrics:
+			text += '# HELP %s %s\n# TYPE %s %s\n' % (name, description, name, kind)
+			for labels, value in samples:
+				text += self.sample(name, labels, value)
+			if kind == 'summary':
+				text += self.sample(name + '_sum', '', round(snapshot['latency_sum'], 6))
+				text += self.sample(name + '_count', '', snapshot['responses'])
+		return text
+
+	def sample(self, name, labels, value):
+		labels = ','.join(label for label in (self.labels, labels) if label)
+		return name + ('{' + labels + '}' if labels else '') + ' ' + str(value) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+	"""
+	GET /metrics of --metrics-port
+	"""
+	def do_GET(self):
+		if self.path != '/metrics':
+			self.send_error(404)
+			return
+		body = metrics.render().encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass  # the console is for the status line
+
+
+def show_progress(offset):
+	"""
+	:param offset: byte offset of the line just processed
+	"""
+	if progress is not None:  # None in the main process of --processes
+		progress.update(offset)
+
+
+def create_threads():
 	for i in range(0, int(conos_config['number_threads'])):
 		tmp_log = 'Thread-' + str(i) + ' created'
 		print(tmp_log)
-		console += '\n' + tmp_log
+		log_console('\n' + tmp_log)
 		thread = AicuuThread(i, 'Thread-' + str(i), workQueue)
 		thread.start()
 		threads.append(thread)
 	print('\n')
 
-def create_queue():
-	global workQueue
-	global openQueue
-	global num_lines
-	count = 0
-
-	with open(data_file_name, "r+", encoding=encode) as fp:
-		for line in fp:
-			if (count != 0) and (count % 1000 == 0):
-				openQueue = True
-				while openQueue:
-					pass
-				openQueue = False
-			workQueue.put(line)
-			count = count + 1
-	fp.close()
-	openQueue = True
+def create_queue(start=0, end=None):
+	"""
+	Feed the input file to the work queue. The queue is bounded, so reading blocks while it is full
+	and the workers block while it is empty. In open-loop mode (--rate) each line is put at its
+	scheduled time. One end-of-input marker (None) is put per thread
+	:param start, end: byte range of the input file to send (whole file by default)
+	"""
+	global count
+	schedule = load_schedule()
+	batcher = create_batcher()
+	for offset, line in read_work(start, end):
+		count += 1
+		scheduled = None
+		if schedule is not None:
+			scheduled = next(schedule)
+			if batcher is not None and batcher.deadline() is not None and batcher.deadline() < scheduled:
+				# do not keep a started batch longer than --batch-wait
+				delay = batcher.deadline() - time.perf_counter()
+				if delay > 0:
+					time.sleep(delay)
+				if not put_work(batcher.flush()):
+					return
+			delay = scheduled - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+		item = (offset, line, scheduled)
+		if batcher is not None:
+			item = batcher.add(item)
+			if item is None:
+				continue
+		if not put_work(item):
+			return
+	if batcher is not None and batcher.items and not put_work(batcher.flush()):
+		return
+	for _ in threads:
+		workQueue.put(None)
 
-def init_value():
+
+def put_work(item):
+	"""
+	Put an item into the work queue, wait while it is full
+	:return: False if every thread has stopped (e.g. got status 403)
+	"""
+	while True:
+		try:
+			workQueue.put(item, timeout=1)
+			return True
+		except Full:
+			if not any(t.is_alive() for t in threads):
+				return False
+
+def init_requests():
+	"""
+	Prepare everything needed to send requests: URL, headers, access token and statistics
+	"""
 	global url
+	global bulk_url
 	global data_file_name
 	global headers
-	global target
-	global num_lines
+	global token_manager
+	global stats
+	global journal
+	global result_writer
+	global retry_policy
+	global breaker
+	global limiter
+	global sync_index
+	global compressor
+	global serializer
+	global metrics
 	url = conos_config['aicuu_url'] + conos_config['endpoint']
+	bulk_url = url + conos_config['bulk_path']
+	serializer = PayloadSerializer(payload_fields[conos_config['endpoint']])
 	data_file_name = conos_config['input_file']
 
-	headers = {'Content-Type': 'application/json; charset=utf-8', 'Authorization': obtain_access_token()}
+	headers = {'Content-Type': 'application/json; charset=utf-8'}
+	token_manager = TokenManager()
+	token_manager.start()
+	stats = RunStatistics(conos_config['window'])
+	retry_policy = RetryPolicy(conos_config['retries'], conos_config['backoff'], conos_config['retry_statuses'])
+	if conos_config['breaker'] > 0:
+		breaker = CircuitBreaker(stats, conos_config['breaker'], conos_config['breaker_pause'])
+	if conos_config['sync_index'] and conos_config['processes'] == 1:  # else: opened by each shard process
+		fields = [name for name, _ in payload_fields[conos_config['endpoint']]]
+		sync_index = SyncIndex(conos_config['sync_index'], conos_config['environment'], conos_config['endpoint'],
+							   payload_fields[conos_config['endpoint']][fields.index('MODIFICATION_DATE')][1])
+	if conos_config['compress']:
+		compressor = BodyCompressor(stats, conos_config['compress'], conos_config['compress_level'],
+									conos_config['compress_min'])
+	if conos_config['adaptive'] is not None:
+		limiter = AdaptiveLimit(stats, int(conos_config['number_threads']), conos_config['adaptive'] / 1000.0)
+	if conos_config['journal_file'] and conos_config['processes'] == 1:  # else: one journal per shard process
+		journal = Journal(conos_config['journal_file'], conos_config['resume'])
+	if conos_config['result_file'] and conos_config['processes'] == 1:  # else: one log per shard process
+		result_writer = ResultWriter(conos_config['result_file'], conos_config['result_format'] == 'tsv')
+		result_writer.start()
+	if conos_config['processes'] == 1:  # else: one exporter per shard process
+		metrics = MetricsExporter(conos_config['status_interval'], conos_config['metrics_file'],
+								  conos_config['metrics_port'],
+								  '' if conos_config['shard'] is None else 'shard="%d"' % conos_config['shard'])
+		metrics.queue = workQueue
+		metrics.start()
+
+
+def init_value():
+	global target
+	global progress
+	init_requests()
 
 	target = open(conos_config['output_file'], "w", encoding=encode)
 	target.truncate()  # Truncating the output file.
 
-	# Get total lines in the input file
-	with open(data_file_name, "r+", encoding=encode) as f:
-		num_lines = sum(1 for _ in f)
-		f.close()
+	# progress is measured in bytes of the input file, no need to count its lines first
+	if conos_config['processes'] == 1:
+		progress = ProgressReporter(os.path.getsize(data_file_name))
 
 def show_release_version():
 	global console
@@ -429,11 +2913,58 @@ def show_input_args():
 			   '\n- Credential: ' + conos_config['client_id'] + '/' + conos_config['client_secret'][:2] + 'xxxxx' + \
 			   '\n- Input data path: ' + conos_config['input_file'] + \
 			   '\n- Output data path: ' + conos_config['output_file'] + \
+			   '\n- Engine: ' + conos_config['engine'] + \
+			   '\n- Total processes: ' + str(conos_config['processes']) + \
 			   '\n- Total threads: ' + conos_config['number_threads'] + \
+			   '\n- Connection pool: ' + str(conos_config['pool_size']) + ', keep-alive ' + str(conos_config['keep_alive']) + 's' + \
+			   '\n- Journal: ' + (conos_config['journal_file'] or 'none') + (' (resume)' if conos_config['resume'] else '') + \
+			   '\n- Result log: ' + (conos_config['result_file'] or 'none') + \
+			   '\n- Retries: ' + str(conos_config['retries']) + ', backoff ' + str(conos_config['backoff']) + 's, on ' + \
+			   ','.join(str(code) for code in conos_config['retry_statuses']) + \
+			   '\n- Circuit breaker: ' + ('error rate > %g, pause %gs' % (conos_config['breaker'], conos_config['breaker_pause'])
+										 if conos_config['breaker'] > 0 else 'off') + \
+			   '\n- Records per request: ' + (str(conos_config['batch']) + ' (bulk: ' + conos_config['endpoint'] +
+											  conos_config['bulk_path'] + ', wait %gms)' % conos_config['batch_wait']
+											  if conos_config['batch'] > 1 else '1') + \
+			   '\n- Compression: ' + ('%s level %d, bodies from %d bytes' % (conos_config['compress'], conos_config['compress_level'],
+																		 conos_config['compress_min'])
+									 if conos_config['compress'] else 'none') + \
+			   '\n- Live metrics: ' + (', '.join(filter(None, [conos_config['metrics_file'], conos_config['metrics_port'] and
+															'http://127.0.0.1:%d/metrics' % conos_config['metrics_port']]))
+									  or 'status line only') + ', every %gs' % conos_config['status_interval'] + \
+			   '\n- Sync index: ' + (conos_config['sync_index'] or 'none (send all records)') + \
+			   '\n- Concurrency: ' + ('fixed' if conos_config['adaptive'] is None else
+									 'adaptive, latency target ' + ('%gms' % conos_config['adaptive'] if conos_config['adaptive'] else 'auto')) + \
+			   '\n- Load: ' + (('open loop, %g requests/s, profile ' % conos_config['rate']) + conos_config['profile'] if conos_config['rate'] else 'closed loop') + \
 			   '\n========================================================'
 	print(console)
 
+def validate_input():
+	"""
+	--validate: check the input file, write the rejected lines and the summary. No request is sent
+	:return: exit status, 0: all records are valid, 1: some are rejected
+	"""
+	global target
+	global console
+	rejects_file = conos_config['validate'] or conos_config['output_file'] + '.rejects'
+	target = open(conos_config['output_file'], "w", encoding=encode)
+	validator = InputValidator(payload_fields[conos_config['endpoint']])
+	rejected = validator.scan(conos_config['input_file'], rejects_file, conos_config['processes'])
+	tmp_log = '\n========================================================' + \
+			  '\nVALIDATION of ' + conos_config['input_file'] + ' (' + str(validator.columns) + ' columns)' + \
+			  validator.summary() + \
+			  '\nRejected lines saved to ' + rejects_file + \
+			  '\n========================================================'
+	print(tmp_log)
+	console += '\n' + tmp_log
+	write_output()
+	target.close()
+	return 1 if rejected else 0
+
+
 def write_output():
+	if target is None:  # output file not open yet
+		return
 	target.write(console)
 	target.flush()
 
@@ -441,13 +2972,19 @@ def main(argv):
 	"""
 	Main function
 	"""
-	if (len(argv) == 1 and argv[0] in ('-h', '--help')) or len(argv) < 6:
+	if len(argv) == 1 and argv[0] in ('-h', '--help'):
+		usage()
+	argv = read_options(argv)
+	if len(argv) < 6:
 		usage()
 	read_arguments(argv)
 	show_release_version()
+	if conos_config['validate'] is not None:
+		sys.exit(validate_input())
 	show_input_args()
 
 	global console
+	global skipped
 	tmp_log = '\n========================================================' + \
 			  '\nStarted processing requests at ' + datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 	print(tmp_log)
@@ -456,42 +2993,97 @@ def main(argv):
 	start = time.time()
 	init_value()
 
-	tmp_log = 'Total requests: ' + str(num_lines) + '\n'
+	tmp_log = 'Input file size: ' + str(os.path.getsize(data_file_name)) + ' bytes\n'
 	print(tmp_log)
 	console += '\n' + tmp_log
 
 	write_output()
 	console = ''
 
-	create_threads()
-	create_queue()
-
-	# Wait for queue to empty
-	while not workQueue.empty():
-		pass
-
-	# Notify threads it's time to exit
-	global exitFlag
-	exitFlag = 1
+	try:
+		if conos_config['processes'] > 1:
+			run_shards()
+			log_console('\n\nDONE 100.000%')
+		elif conos_config['engine'] == 'async':
+			asyncio.run(run_async_engine())
+			if not worker_aborted:
+				log_console('\n\nDONE 100.000%')
+		else:
+			create_threads()
+			create_queue()
 
-	console += '\n\nDONE 100.000%'
-	# Wait for all threads to complete
-	for t in threads:
-		t.join()
+			# Wait for all threads to complete
+			for t in threads:
+				t.join()
+			if not worker_aborted:
+				log_console('\n\nDONE 100.000%')
+	except KeyboardInterrupt:
+		tmp_log = '\nInterrupted.'
+		if conos_config['journal_file']:
+			tmp_log += ' Run again with --resume to send the remaining requests.'
+		print(tmp_log)
+		log_console(tmp_log)
+		flush_console()
+		sys.exit(130)
+	finally:
+		if journal is not None:
+			journal.close()
+		if result_writer is not None:
+			result_writer.close()
+		if sync_index is not None:
+			sync_index.close()
+	if journal is not None:
+		skipped = journal.skipped
+	if progress is not None and not worker_aborted:
+		progress.update(progress.total_bytes)
+	if metrics is not None:
+		metrics.stop()
+	if worker_aborted:
+		tmp_log = '\nAborted: got status 403 (access denied), not every line was sent.'
+		if conos_config['journal_file']:
+			tmp_log += ' Run again with --resume to send the remaining requests.'
+		print(tmp_log)
+		console += tmp_log
 	tmp_log = '\nExiting Main Thread'
 	print(tmp_log)
 	console += tmp_log
 	finish = time.time()
+	if breaker is not None:
+		breaker.stop()
+	token_manager.stop()
+	opened, reused = connection_stats()
+	failed = count - success - unchanged
 
 	tmp_log = '\nFinish at : ' + datetime.now().strftime('%Y-%m-%d %H:%M:%S') + '. Duration: ' + total_time(round(finish - start)) + \
+			  '\nTotal requests: ' + str(count) + \
 			  '\nSuccess: ' + str(success) + \
-			  '\nFailed: ' + str(num_lines - success) + \
+			  '\nFailed: ' + str(failed) + \
+			  '\nSkipped (finished by an earlier run): ' + str(skipped) + \
+			  '\nUnchanged since the last sync (not sent): ' + str(unchanged) + \
+			  '\nConnections opened: ' + str(opened) + \
+			  '\nConnections reused: ' + str(reused) + \
+			  '\nAccess tokens obtained: ' + str(token_manager.refresh_count) + \
+			  stats.summary() + \
 			  '\n========================================================'
 	print(tmp_log)
 	console += '\n' + tmp_log
 
+	if conos_config['report_file']:
+		report = {'endpoint': conos_config['endpoint'], 'environment': conos_config['environment'],
+				  'engine': conos_config['engine'], 'processes': conos_config['processes'],
+				  'threads': int(conos_config['number_threads']),
+				  'rate': conos_config['rate'], 'profile': conos_config['profile'],
+				  'duration_seconds': round(finish - start, 3), 'total': count, 'success': success,
+				  'failed': failed, 'skipped': skipped, 'unchanged': unchanged, 'connections_opened': opened, 'connections_reused': reused,
+				  'access_tokens': token_manager.refresh_count, 'aborted': worker_aborted}
+		report.update(stats.to_dict())
+		with open(conos_config['report_file'], 'w') as fp:
+			json.dump(report, fp, indent=4)
+
 	write_output()
 	target.close()
+	if worker_aborted:
+		sys.exit(1)
 
 if __name__ == "__main__":
 	main(sys.argv[1:])  # sys.argv[0] is the name of the script; we don't care about that
\ No newline at end of file
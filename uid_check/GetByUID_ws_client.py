@@ -31,8 +31,21 @@
 #                              + 2: run zefix only
 #                              + 1/2: run Web service first. If not found, then try with zefix
 #                              + 2/1: run zefix first. If not found, then try with Web service
-#                            <LIMIT_PER_MINUTE>: (Optional) Maximum UID check per a minute. Example: 120
-#                            Default is do as many as possible.
+#                            <LIMIT_PER_MINUTE>: (Optional) Maximum HTTP calls per a minute to each service, spread
+#                            evenly over the minute. Example: 120. Separate limits for the Web service and zefix:
+#                            WEBSERVICE/ZEFIX, e.g. 120/60. A zefix check makes 2 calls.
+#                            Default is do as many as possible. -1: no limit
+#                            <NUMBER_WORKERS>: (Optional) UIDs checked at the same time, from 1 -> 64. Default is 1.
+#                            The output file keeps the order of the input file.
+#                            Options (optional, anywhere in the argument list):
+#                              --cache=FILE: SQLite cache of the results of earlier runs. A cached UID is not sent
+#                                to the services again while its result is fresh
+#                              --cache-ttl=DAYS: how long a found UID stays fresh (default 30)
+#                              --cache-ttl-not-found=DAYS: how long a not found UID stays fresh (default 1)
+#                              --wsdl=FILE_OR_URL: WSDL of the Web service, e.g. a local copy (default: the URL above)
+#                              --wsdl-cache=FILE: SQLite cache of the WSDL and XSD documents (default: the cache of
+#                                the zeep library in the user cache directory). Documents are downloaded once a week
+#                                at most; with a local WSDL copy and a filled cache, nothing is downloaded at start
 #    Outputparameters......: None
 #
 #    Example Function call:
@@ -42,6 +55,9 @@
 #       2,
 #         python GetByUID_ws_client.py input.txt output.txt 1/2 120
 #         python GetByUID_ws_client.py input.txt
+#         python GetByUID_ws_client.py input.txt output.txt 1/2 -1 16
+#         python GetByUID_ws_client.py input.txt output.txt 1/2 120/60 16 --cache=uid_cache.db
+#         python GetByUID_ws_client.py input.txt output.txt 1 --wsdl=PublicServices.wsdl
 #
 #    Release notes:
 #       07.11.2017 Sunwheel
@@ -49,15 +65,26 @@
 #       14.11.2017 Sunwheel
 #           Add additional UID check service zefix.ch
 #           Apply limit UID check per a minute
+#       17.10.2026 Sunwheel
+#           Read the input file once, in large chunks. Progress from the byte offset, twice a second
+#           Check UIDs concurrently with a pool of workers (NUMBER_WORKERS), output in input order
+#           LIMIT_PER_MINUTE: token bucket per service, charged per HTTP call, instead of bursts and sleeps
+#           Persistent cache of the results with separate TTLs for found and not found UIDs (--cache)
+#           WSDL client created on the first Web service request, WSDL and XSD documents cached (--wsdl, --wsdl-cache)
+#           One lookup per distinct UID (CHE239622886 = CHE-239.622.886), its result written for every line
 #  =====================================================================================================================
 
-from zeep import Client
-import zeep
 from datetime import datetime
 import sys
 import time
 import requests
 import json
+import os
+import collections
+import sqlite3
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 
 # basic release version
 script_name = 'GetByUID_ws_client.py'
@@ -65,9 +92,14 @@ version = '1.1.0'
 release_date = '14.11.2017'
 encode = 'windows-1252'
 
-# webservice wsdl
+# webservice wsdl, or a local copy of it (--wsdl)
 wsdl = 'https://www.uid-wse.admin.ch/V3.0/PublicServices.svc?WSDL'
-client = None
+wsdl_cache_file = None  # None: default location of the zeep cache
+wsdl_cache_ttl = 7 * 86400  # seconds the WSDL and XSD documents are cached
+client = None  # created by the first Web service request, see get_client()
+client_failed = False
+client_lock = threading.Lock()
+zeep = None  # imported by init_wsdl_client(), not needed with zefix only
 
 # https://www.zefix.ch
 zefix_api = 'https://www.zefix.ch/ZefixREST/api/v1/firm/'
@@ -79,10 +111,19 @@ input_file = ''
 output_file = ''
 source = '1/2'
 limit = '-1'  # -1: do as many as possible
-
-mode = ''  # 1: webservice, 2: zefix.ch
+webservice_limiter = None  # TokenBucket, None: no limit
+zefix_limiter = None
+workers = 1
+max_workers = 64
+cache_file = None
+cache_ttl = 30.0  # days
+cache_ttl_not_found = 1.0  # days
+cache = None  # UidCache
 
 total_uid = 0  # from input file, 1 line <-> 1 uid
+distinct_uid = 0  # distinct UIDs, after normalization (normalize_uid). Looked up unless the cache has them
+read_chunk_size = 1024 * 1024  # bytes read from the input file at once
+progress = None
 
 # result
 found_uid_count = 0
@@ -95,7 +136,7 @@ def usage():
     """
     print()
     print('\t Usage: python GetByUID_ws_client.py [-h] [--help] <INPUT_FILE> <OUTPUT_FILE> <SERVICE_SOURCE> '
-          '<LIMIT_PER_MINUTE>')
+          '<LIMIT_PER_MINUTE> <NUMBER_WORKERS>')
     print('\t -h                : help')
     print('\t INPUT_FILE        : location of the input file')
     print('\t OUTPUT_FILE       : (optional)location of the output file')
@@ -105,8 +146,16 @@ def usage():
     print('\t\t\t 2: run zefix only')
     print('\t\t\t 1/2: run Web service first. If not found, then try with zefix')
     print('\t\t\t 2/1: run zefix first. If not found, then try with Web service')
-    print('\t LIMIT_PER_MINUTE  : (Optional) Maximum UID check per a minute. Default is do as many as possible.')
+    print('\t LIMIT_PER_MINUTE  : (Optional) Maximum calls per a minute to each service. Default is do as many as possible.')
+    print('\t\t WEBSERVICE/ZEFIX: separate limits, e.g. 120/60. -1: no limit')
+    print('\t NUMBER_WORKERS    : (Optional) UIDs checked at the same time (from 1 -> 64, default is 1)')
+    print('\t --cache           : (Optional) SQLite cache of earlier results, fresh results are not checked again')
+    print('\t --cache-ttl       : (Optional) days a found UID stays fresh in the cache (default 30)')
+    print('\t --cache-ttl-not-found: (Optional) days a not found UID stays fresh in the cache (default 1)')
+    print('\t --wsdl            : (Optional) WSDL file or URL of the Web service, e.g. a local copy')
+    print('\t --wsdl-cache      : (Optional) SQLite cache of the WSDL and XSD documents (default: the zeep cache)')
     print('\n\t Example           : python GetByUID_ws_client.py input.txt output.txt 1/2 120')
+    print('\t                     python GetByUID_ws_client.py input.txt output.txt 1/2 120/60 16')
     exit(2)
 
 
@@ -119,7 +168,12 @@ def show_basic_info():
     print("Input file:", input_file)
     print("Output file:", output_file)
     print("Source of UID check:", get_source())
-    print("Max UID check per a minute:", get_limit())
+    print("Max calls per a minute:", get_limit())
+    print("Workers:", workers)
+    if source != '2':
+        print("WSDL:", wsdl, '(cache: ' + (wsdl_cache_file or 'zeep default') + ')')
+    print("Cache:", cache_file + ' (fresh for %g days if found, %g days if not found)' % (cache_ttl, cache_ttl_not_found)
+          if cache_file else 'none')
     print('========================================================')
 
 
@@ -139,10 +193,70 @@ def get_source():
 
 
 def get_limit():
-    if limit == '-1':
+    if webservice_limiter is None and zefix_limiter is None:
         return 'No limit. Do as many as possible'
-    else:
-        return limit
+    return 'Web service ' + (webservice_limiter.describe() if webservice_limiter else 'no limit') + \
+           ', zefix.ch ' + (zefix_limiter.describe() if zefix_limiter else 'no limit')
+
+
+def create_limiters(value):
+    """
+    Create the rate limiters of LIMIT_PER_MINUTE
+    :param value: N (both services) or WEBSERVICE/ZEFIX, -1: no limit
+    :return: False if the value is not valid
+    """
+    global webservice_limiter
+    global zefix_limiter
+    limits = value.split('/')
+    if len(limits) == 1:
+        limits = limits * 2
+    if len(limits) != 2 or not all(part == '-1' or (part.isdigit() and int(part) > 0) for part in limits):
+        return False
+    if limits[0] != '-1':
+        webservice_limiter = TokenBucket(int(limits[0]))
+    if limits[1] != '-1':
+        zefix_limiter = TokenBucket(int(limits[1]))
+    return True
+
+
+class TokenBucket:
+    """
+    Rate limit of the HTTP calls to one service, shared by all workers. Tokens are added at `rate_per_minute` / 60
+    a second, up to `burst`. Each call takes one; a call without a token reserves the next one and waits for it,
+    so the calls are spread evenly over the minute instead of coming in a burst
+    """
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate_per_minute = rate_per_minute
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.waited = 0.0  # seconds, all workers
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1  # below 0: reserved, wait until it is paid back
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.calls += 1
+            self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+
+    def describe(self):
+        return str(self.rate_per_minute) + ' calls/minute'
+
+
+def rate_limit(limiter):
+    """
+    Wait for the rate limit of a service before calling it
+    """
+    if limiter is not None:
+        limiter.acquire()
 
 
 def total_time(diff):
@@ -169,6 +283,75 @@ def prepare_uid_request(uid):
     return uid_dict
 
 
+def normalize_uid(uid):
+    """
+    :param uid: Example CHE239622886 or CHE-239.622.886
+    :return: the UID as the Web service gets it (prepare_uid_request), as one string. Example CHE239622886.
+    The case is kept: the lines of one normalized UID are all sent the same request
+    """
+    uid_dict = prepare_uid_request(uid)
+    return uid_dict['uidOrganisationIdCategorie'] + uid_dict['uidOrganisationId']
+
+
+def source_services():
+    """
+    :return: the services of SERVICE_SOURCE, 1: webservice, 2: zefix.ch
+    """
+    return {'1': '1', '2': '2', '3': '12', '4': '12'}[source]
+
+
+class UidCache:
+    """
+    Results of earlier runs (--cache), in a SQLite database keyed by the normalized UID (normalize_uid()):
+    the result, the service of the result (mode), the services asked and when. Found UIDs stay fresh for
+    `found_ttl` seconds, not found ones for `not_found_ttl` seconds. Used by the main thread only
+    """
+    commit_every = 500  # results
+
+    def __init__(self, file_name, found_ttl, not_found_ttl):
+        self.found_ttl = found_ttl
+        self.not_found_ttl = not_found_ttl
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self.db = sqlite3.connect(file_name)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS uid_result (uid TEXT PRIMARY KEY, result TEXT NOT NULL, '
+                        'mode TEXT NOT NULL, services TEXT NOT NULL, checked_at REAL NOT NULL)')
+
+    def get(self, uid, services):
+        """
+        :param services: services of this run. A found result is used if its service is one of them, a not found
+        result if all of them were asked
+        :return: (result, mode) if a fresh result is cached, else None
+        """
+        row = self.db.execute('SELECT result, mode, services, checked_at FROM uid_result WHERE uid = ?',
+                              (normalize_uid(uid),)).fetchone()
+        if row is not None:
+            result, mode, asked, checked_at = row
+            if result:
+                fresh = time.time() - checked_at < self.found_ttl and mode in services
+            else:
+                fresh = time.time() - checked_at < self.not_found_ttl and set(services) <= set(asked)
+            if fresh:
+                self.hits += 1
+                return result, mode
+        self.misses += 1
+        return None
+
+    def put(self, uid, result, mode, services):
+        self.db.execute('INSERT OR REPLACE INTO uid_result (uid, result, mode, services, checked_at) '
+                        'VALUES (?, ?, ?, ?, ?)', (normalize_uid(uid), result, mode, services, time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.db.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
 def xstr(s):
     """
     behave like the str() built-in, but return an empty string when the argument is None
@@ -178,32 +361,98 @@ def xstr(s):
     return str(s)
 
 
-def show_progress(progress):
-    sys.stdout.write("\rDONE %.3f%%" % (float(progress) * 100 / float(total_uid)))
-    sys.stdout.flush()
+class ProgressReporter:
+    """
+    Show 'DONE x%' from the byte offset of the last written line of the input file, at most `refresh_rate`
+    times a second
+    """
+    def __init__(self, total_bytes, refresh_rate=2):
+        self.total_bytes = max(total_bytes, 1)
+        self.interval = 1.0 / refresh_rate
+        self._next_refresh = 0.0
+
+    def update(self, position, force=False):
+        now = time.monotonic()
+        if now < self._next_refresh and not force:
+            return
+        self._next_refresh = now + self.interval
+        sys.stdout.write("\rDONE %.3f%%" % (min(position, self.total_bytes) * 100.0 / self.total_bytes))
+        sys.stdout.flush()
+
+
+def show_progress(position):
+    """
+    :param position: byte offset of the line just written
+    """
+    progress.update(position)
+
+
+def read_lines(file_name):
+    """
+    Read a file once, in large chunks. A copy of read_lines() of aicuu_mass_test/conos_aicuu_client.py, with the
+    same byte offsets: both scripts are run on their own, from their own directory
+    :return: generator of (byte offset of the line, line without line break)
+    """
+    with open(file_name, "rb", buffering=0) as fp:
+        position = 0
+        rest = b''  # incomplete last line of the previous chunk
+        while True:
+            chunk = fp.read(read_chunk_size)
+            if not chunk:
+                break
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            for raw in lines:
+                offset = position
+                position += len(raw) + 1
+                yield offset, raw.rstrip(b'\r').decode(encode)
+        if rest:  # last line without line break
+            yield position, rest.rstrip(b'\r').decode(encode)
 
 
 def init_wsdl_client():
     # initialize webservice WSDL client (supported by zeep library)
-    # this will take around 10 seconds.
+    # parsing the WSDL takes around 10 seconds when its documents are downloaded, they are kept in a SQLite cache
     global client
-    print('Initializing WSDL client at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    global zeep
+    import zeep
+    from zeep.cache import SqliteCache
+    from zeep.transports import Transport
+    print('\nInitializing WSDL client at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    started = time.perf_counter()
     try:
-        client = Client(wsdl=wsdl)
-    except requests.exceptions.HTTPError as e:
+        transport = Transport(cache=SqliteCache(path=wsdl_cache_file, timeout=wsdl_cache_ttl))
+        client = zeep.Client(wsdl=wsdl, transport=transport)
+    except (requests.exceptions.RequestException, OSError) as e:
         # Stop the script if WSDL is not correct
         print('Oops! Error when connecting to the Web service WSDL')
         print('Cause: ', e)
         sys.exit(1)
+    print('WSDL client ready in %.2f seconds' % (time.perf_counter() - started))
+
+
+def get_client():
+    """
+    :return: the WSDL client, created by the first caller. The other workers wait for it
+    """
+    global client_failed
+    if client is None:
+        with client_lock:
+            if client_failed:  # reported by the first caller
+                sys.exit(1)
+            if client is None:
+                client_failed = True
+                init_wsdl_client()
+                client_failed = False
+    return client
 
 
 def webservice_request(uid):
-    global mode
-    mode = '1'  # webservice
     # request data will be sent to the Web service
     uid_dict = prepare_uid_request(uid)
+    rate_limit(webservice_limiter)
     try:
-        result = client.service.GetByUID(uid=uid_dict)
+        result = get_client().service.GetByUID(uid=uid_dict)
     except zeep.exceptions.Fault:  # error from Web service
         return ''
 
@@ -229,20 +478,20 @@ def webservice_request(uid):
 
 
 def zefix_request(uid):
-    global mode
-    mode = '2'  # zefix
-    zefix_payload['name'] = uid
+    payload = dict(zefix_payload, name=uid)  # zefix_payload is shared by all workers
     url = zefix_api + 'search.json'
 
     retry_times = 0
     # have to make 2 rest api calls to zefix to get enough data
     while retry_times < 2:
         try:
-            response1 = requests.post(url=url, data=json.dumps(zefix_payload, indent=4), timeout=60,
+            rate_limit(zefix_limiter)
+            response1 = requests.post(url=url, data=json.dumps(payload, indent=4), timeout=60,
                                       headers=zefix_http_headers)
             if response1.ok:  # uid found
                 ehraid = response1.json()['list'][0]['ehraid']
                 url = zefix_api + str(ehraid) + '.json'
+                rate_limit(zefix_limiter)
                 response2 = requests.get(url=url, timeout=60)
                 if response2.ok:  # assume, ehraid found always
                     json_resp = response2.json()
@@ -267,7 +516,34 @@ def zefix_request(uid):
             retry_times += 1
 
 
-def build_output_line(result, uid):
+def check_uid(uid):
+    """
+    Check one UID with the services of SERVICE_SOURCE. Runs in the worker threads
+    :return: (result, mode). result: tab separated company data, '' if not found, None if zefix could not be
+    reached. mode: service of the result, 1: webservice, 2: zefix.ch
+    """
+    # zefix only (2), or zefix -> webservice (4)
+    if source == '2' or source == '4':
+        mode = '2'
+        result = zefix_request(uid)
+        if result == '' and source == '4':
+            mode = '1'
+            result = webservice_request(uid)
+
+    # webservice only (1), or webservice -> zefix (3)
+    if source == '1' or source == '3':
+        mode = '1'
+        result = webservice_request(uid)
+        if result == '' and source == '3':
+            mode = '2'
+            result = zefix_request(uid)
+    return result, mode
+
+
+def build_output_line(result, uid, mode):
+    """
+    Called in input order by the main thread only, the counters need no lock
+    """
     global found_uid_count
     global not_found_uid_count
     tabs = '\t\t\t\t\t\t'
@@ -280,6 +556,61 @@ def build_output_line(result, uid):
     return output_line
 
 
+def write_result(target, lookup, count_flush):
+    """
+    Wait for a lookup and write its output line
+    :param lookup: (byte offset after the line, UID, future of check_uid() or None for an empty line, True if
+    the result is new and goes to the cache: first line of the UID, not from the cache)
+    :return: output lines written since the last flush
+    """
+    position, uid, future, store = lookup
+    if future is not None:
+        result, mode = future.result()
+        if result is None:  # zefix could not be reached, not cached
+            result = ''
+        elif cache is not None and store:
+            cache.put(uid, result, mode, source_services())
+        target.write(build_output_line(result, uid, mode) + '\n')
+        count_flush += 1
+        if count_flush == 50:
+            count_flush = 0
+            target.flush()
+    show_progress(position)
+    return count_flush
+
+
+def read_options(argv):
+    """
+    Read optional '--name=value' arguments
+    :return: the remaining (positional) arguments
+    """
+    global cache_file
+    global cache_ttl
+    global cache_ttl_not_found
+    global wsdl
+    global wsdl_cache_file
+    positional = []
+    for arg in argv:
+        if not arg.startswith('--') or arg == '--help':
+            positional.append(arg)
+            continue
+        name, _, value = arg[2:].partition('=')
+        if name == 'cache' and value:
+            cache_file = value
+        elif name == 'cache-ttl' and value.replace('.', '', 1).isdigit():
+            cache_ttl = float(value)
+        elif name == 'wsdl' and value:
+            wsdl = value
+        elif name == 'wsdl-cache' and value:
+            wsdl_cache_file = value
+        elif name == 'cache-ttl-not-found' and value.replace('.', '', 1).isdigit():
+            cache_ttl_not_found = float(value)
+        else:
+            print('Unknown or invalid option: ' + arg)
+            usage()
+    return positional
+
+
 def main(argv):
     """
     Main function
@@ -288,8 +619,11 @@ def main(argv):
     global output_file
     global source
     global limit
+    global workers
     global client
+    global cache
 
+    argv = read_options(argv)
     # validate required arguments
     if (len(argv) == 1 and argv[0] in ('-h', '--help')) or len(argv) == 0:
         usage()
@@ -299,7 +633,6 @@ def main(argv):
     if len(argv) >= 2:
         output_file = argv[1].strip()
     else:  # Define default output file
-        import os
         # output file = /path/to/input_file/directory/GetByUID_ws_client_OUTPUT.txt
         output_file = os.path.dirname(input_file).join('GetByUID_ws_client_OUTPUT.txt')
 
@@ -316,84 +649,97 @@ def main(argv):
             sys.exit(2)
 
     # max UID check per a minute. Default is no limit (Do as many as possible)
-    if len(argv) == 4:
+    if len(argv) >= 4:
         limit = argv[3].strip()
+        if not create_limiters(limit):
+            print('Argument \'' + limit + '\' is not allowed. Valid values: N, WEBSERVICE/ZEFIX (e.g. 120/60) or -1')
+            sys.exit(2)
+
+    # UIDs checked at the same time. Default is 1
+    if len(argv) >= 5:
+        if not argv[4].strip().isdigit() or not 1 <= int(argv[4]) <= max_workers:
+            print('Argument \'' + argv[4] + '\' is not allowed. Valid values: 1 -> ' + str(max_workers))
+            sys.exit(2)
+        workers = int(argv[4])
 
     show_basic_info()
     print('\n========================================================')
     start = time.time()
 
-    if source != '2':
-        init_wsdl_client()
+    if cache_file:
+        cache = UidCache(cache_file, cache_ttl * 86400, cache_ttl_not_found * 86400)
 
     # Open output file, truncate the output file if exist
     target = open(output_file, "w", encoding=encode)
     target.truncate()
 
-    # Get total lines (total uid) in the input file
+    # Progress is measured in bytes of the input file, no need to count its lines first
     global total_uid
-    with open(input_file, "r", encoding=encode) as f:
-        total_uid = sum(1 for _ in f)
-    f.close()
-    print('Total UID quantity:', total_uid)
+    global distinct_uid
+    global progress
+    progress = ProgressReporter(os.path.getsize(input_file))
+    print('Input file size:', os.path.getsize(input_file), 'bytes')
     print('Started processing requests at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
     count_flush = 0  # finish process 500 uid -> flush result to the output file
-    progress = 0
-    count_limit = 0
-    with open(input_file, "r", encoding=encode) as fr:
-        start_time_limit = time.time()
-        for line in fr:
-            progress += 1
+    empty_lines = 0
+    # lookups in flight, in input order: (position, uid, future). At most 2 per worker, so the input file is
+    # not read ahead further than needed
+    pending = collections.deque()
+    lookups = dict()  # normalized UID -> future of its lookup, shared by all lines of the UID
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for position, line in read_lines(input_file):
+            total_uid += 1
             line = line.strip()
             # Skip empty line
             if len(line) == 0:
                 print('WARN: 1 empty uid found')
-                show_progress(progress)
+                empty_lines += 1
+                pending.append((position, line, None, False))
                 continue
 
-            # zefix only (2), or zefix -> webservice (4)
-            if source == '2' or source == '4':
-                result = zefix_request(line)
-                if result == '' and source == '4':
-                    result = webservice_request(line)
-                output_line = build_output_line(result, line)
-
-            # webservice only (1), or webservice -> zefix (3)
-            if source == '1' or source == '3':
-                result = webservice_request(line)
-                if result == '' and source == '3':
-                    result = zefix_request(line)
-                output_line = build_output_line(result, line)
-
-            target.write(output_line + '\n')
-            count_flush += 1
-            if count_flush == 50:
-                count_flush = 0
-                target.flush()
-            show_progress(progress)
-
-            count_limit += 1
-            if str(count_limit) == limit:
-                count_flush = 0
-                target.flush()
-                sleep_time = start_time_limit + 60 - time.time()  # seconds
-                if sleep_time > 0:
-                    print('Reached the limit. Wait for ', sleep_time, ' seconds to continue...')
-                    time.sleep(sleep_time)
-                count_limit = 0
-                start_time_limit = time.time()
+            key = normalize_uid(line)
+            if key in lookups:  # same UID as an earlier line, maybe written in another form
+                pending.append((position, line, lookups[key], False))
+            else:
+                distinct_uid += 1
+                cached = cache.get(line, source_services()) if cache is not None else None
+                if cached is not None:  # no request at all
+                    future = Future()
+                    future.set_result(cached)
+                else:
+                    future = pool.submit(check_uid, line)
+                lookups[key] = future
+                pending.append((position, line, future, cached is None))
+            while len(pending) > workers * 2:
+                count_flush = write_result(target, pending.popleft(), count_flush)
+
+        while pending:
+            count_flush = write_result(target, pending.popleft(), count_flush)
 
     target.flush()
     target.close()
-    fr.close()
+    if cache is not None:
+        cache.close()
+
+    progress.update(progress.total_bytes, force=True)
 
     finish = time.time()
     print('\n\nFinish at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     print('Duration: ', total_time(round(finish - start)))
     print('Brief summary:')
+    print(' + Total UID quantity:', total_uid)
+    print(' + Distinct UID:', distinct_uid, '(%.2f lines per distinct UID, repeated ones are not looked up again)'
+          % ((total_uid - empty_lines) / float(max(distinct_uid, 1))))
+    print(' + UID looked up:', distinct_uid - (cache.hits if cache is not None else 0))
     print(' + Total found UID:', found_uid_count)
     print(' + Total not found UID:', not_found_uid_count)
+    for name, limiter in (('Web service', webservice_limiter), ('zefix.ch', zefix_limiter)):
+        if limiter is not None:
+            print(' + Calls to the ' + name + ':', limiter.calls,
+                  '(workers waited %.1f seconds in total for the rate limit)' % limiter.waited)
+    if cache is not None:
+        print(' + Cache hits (not looked up):', cache.hits, '| misses:', cache.misses)
     print('========================================================')
 
 